@@ -0,0 +1,161 @@
+'''Debounced SN173 switch input with gesture detection
+    Switches are monitored for HOOK_GPIN events. The first edge is taken at once, and getMs()
+    timestamps lock out the contact bounce that follows it for DEBOUNCE_MS. buttons_tick10ms() only
+    does work while a switch is settling or a gesture is still being timed; when idle it returns at
+    once, so input costs nothing until a switch moves.
+    Each gesture produces one call to its switch's handler, by name: handler(index, gesture)
+
+    Usage:
+        buttons_init(('s1_event', 's2_event', 's3_event', 's4_event'))
+        ...
+        @setHook(HOOK_GPIN)
+        def pin_event(pin, is_set):
+            buttons_gpin(pin, is_set)
+
+        @setHook(HOOK_10MS)
+        def tick10ms():
+            buttons_tick10ms()
+'''
+from SN173 import *
+
+# Gestures
+GESTURE_PRESS = 1    # Single click, reported once the double-click window has passed
+GESTURE_DOUBLE = 2   # Two clicks within DOUBLE_GAP_MS
+GESTURE_LONG = 3     # Held for LONG_MS, reported while still held
+
+# Timing, in milliseconds
+DEBOUNCE_MS = 30
+LONG_MS = 800
+DOUBLE_GAP_MS = 300
+
+# Per-switch state, packed in one integer:
+#   bit 14 = pressed, bit 13 = long-press reported, bit 12 = settling (ignoring bounce), bits 9-10 = clicks
+ST_PRESSED = 0x4000
+ST_LONG = 0x2000
+ST_SETTLING = 0x1000
+ST_CLICKS_SHIFT = 9
+
+btn_state0 = btn_state1 = btn_state2 = btn_state3 = 0
+btn_ms0 = btn_ms1 = btn_ms2 = btn_ms3 = 0   # getMs() at each switch's last debounced edge
+btn_active = 0      # Bit per switch with a settle or gesture timer running
+btn_handlers = None
+
+def buttons_init(handlers):
+    """Configure switches as monitored inputs with pull-ups. handlers is a tuple of 4 function names."""
+    global btn_handlers
+    btn_handlers = handlers
+    i = 0
+    while i < len(SWITCH_TUPLE):
+        setPinDir(SWITCH_TUPLE[i], False)
+        setPinPullup(SWITCH_TUPLE[i], True)
+        monitorPin(SWITCH_TUPLE[i], True)
+        i += 1
+
+def buttons_gpin(pin, is_set):
+    """Call this from HOOK_GPIN"""
+    i = 0
+    while i < len(SWITCH_TUPLE):
+        if SWITCH_TUPLE[i] == pin:
+            st = get_button_state(i)
+            # Bounce after an edge is ignored; the settle check in button_step() catches the final level
+            if not st & ST_SETTLING:
+                button_set(i, button_edge(i, st, not is_set, getMs()))  # Active low
+            return
+        i += 1
+
+def buttons_tick10ms():
+    """Call this from 10ms timer hook"""
+    global btn_state0, btn_state1, btn_state2, btn_state3
+    if not btn_active:
+        return
+    now = getMs()
+    if btn_active & 0x01:
+        btn_state0 = button_step(0, btn_state0, btn_ms0, now)
+    if btn_active & 0x02:
+        btn_state1 = button_step(1, btn_state1, btn_ms1, now)
+    if btn_active & 0x04:
+        btn_state2 = button_step(2, btn_state2, btn_ms2, now)
+    if btn_active & 0x08:
+        btn_state3 = button_step(3, btn_state3, btn_ms3, now)
+
+def button_edge(index, st, down, now):
+    """Apply a debounced edge (if down differs from the current state). Returns new state."""
+    if down == ((st & ST_PRESSED) != 0):
+        return st
+    set_button_ms(index, now)
+    st = (st & ~ST_PRESSED) | ST_SETTLING
+    if down:
+        return (st & ~ST_LONG) | ST_PRESSED
+    if st & ST_LONG:
+        return st
+    clicks = ((st >> ST_CLICKS_SHIFT) & 0x03) + 1
+    if clicks == 2:
+        clicks = 0
+        button_gesture(index, GESTURE_DOUBLE)
+    return (st & ~(0x03 << ST_CLICKS_SHIFT)) | (clicks << ST_CLICKS_SHIFT)
+
+def button_step(index, st, edge_ms, now):
+    """Check one active switch's settle and gesture timers. Returns new state."""
+    elapsed = now - edge_ms   # 16-bit wrap is harmless for intervals this short
+    if st & ST_SETTLING and elapsed >= DEBOUNCE_MS:
+        st &= ~ST_SETTLING
+        # Catch an edge lost in the bounce lockout
+        st = button_edge(index, st, not readPin(SWITCH_TUPLE[index]), now)
+        if st & ST_SETTLING:
+            elapsed = 0
+
+    clicks = (st >> ST_CLICKS_SHIFT) & 0x03
+    if st & ST_PRESSED:
+        if not st & ST_LONG and elapsed >= LONG_MS:
+            st = (st & ~(0x03 << ST_CLICKS_SHIFT)) | ST_LONG
+            button_gesture(index, GESTURE_LONG)
+    elif clicks and elapsed >= DOUBLE_GAP_MS:
+        st &= ~(0x03 << ST_CLICKS_SHIFT)
+        button_gesture(index, GESTURE_PRESS)
+
+    set_button_active(index, st)
+    return st
+
+def button_set(index, st):
+    global btn_state0, btn_state1, btn_state2, btn_state3
+    if index == 0:
+        btn_state0 = st
+    elif index == 1:
+        btn_state1 = st
+    elif index == 2:
+        btn_state2 = st
+    else:
+        btn_state3 = st
+    set_button_active(index, st)
+
+def set_button_active(index, st):
+    """Keep the tick running for a switch while it is settling, holding short of a long press, or has clicks pending"""
+    global btn_active
+    if st & (ST_SETTLING | (0x03 << ST_CLICKS_SHIFT)) or (st & ST_PRESSED and not st & ST_LONG):
+        btn_active |= 1 << index
+    else:
+        btn_active &= ~(1 << index)
+
+def get_button_state(index):
+    if index == 0:
+        return btn_state0
+    elif index == 1:
+        return btn_state1
+    elif index == 2:
+        return btn_state2
+    return btn_state3
+
+def set_button_ms(index, ms):
+    global btn_ms0, btn_ms1, btn_ms2, btn_ms3
+    if index == 0:
+        btn_ms0 = ms
+    elif index == 1:
+        btn_ms1 = ms
+    elif index == 2:
+        btn_ms2 = ms
+    else:
+        btn_ms3 = ms
+
+def button_gesture(index, gesture):
+    handler = btn_handlers[index]
+    handler(index, gesture)
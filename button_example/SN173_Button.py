@@ -6,47 +6,40 @@
 '''SNAPpy Button Demo
     Sample SNAPpy script to demonstrate one method of invoking an action based on an input toggle.
     This script is intended to be used with the SN173 evaluation boards.
+    Each switch S1-S4 controls the matching LED: click toggles it, double-click blinks it,
+    long-press turns it off.
 '''
 from SN173 import *
+from Buttons import *
 
 # Run start-up function
 @setHook(HOOK_STARTUP)
 def start_up():
-    # Set pin direction as input
-    setPinDir(S1, False)
-    setPinDir(S2, False)
+    # Debounced input on all four switches, each reporting to button_event()
+    buttons_init(('button_event', 'button_event', 'button_event', 'button_event'))
     
-    # Enable internal pull-up resistor
-    setPinPullup(S1, True)
-    setPinPullup(S2, True)
-    
-    # Setup pin to be monitored
-    monitorPin(S1, True)
-    monitorPin(S2, True)
-    
-    # Set pin direction as output
-    setPinDir(LED1, True)
-    setPinDir(LED2, True)
-    
-    # Set LED default state to off
-    writePin(LED1, False)
-    writePin(LED2, False)
-    
-# Monitor pin event hook
+    i = 0
+    while i < len(LED_TUPLE):
+        # Set pin direction as output, LED default state off
+        setPinDir(LED_TUPLE[i], True)
+        writePin(LED_TUPLE[i], False)
+        i += 1
+
+# Switch edges start debouncing; the 10ms tick then times gestures until the switch is idle again
 @setHook(HOOK_GPIN)
-def button_event(pin, set):
-    
-    # If Switch1 is pressed, turn on LED2
-    if pin == S1:
-        if not set:
-            writePin(LED1, True)
-        else:
-            writePin(LED1, False)
-    
-    # If Switch2 is pressed, turn on LED2
-    if pin == S2:
-        if not set:
-            writePin(LED2, True)
-        else:
-            writePin(LED2, False)
-            
\ No newline at end of file
+def pin_event(pin, is_set):
+    buttons_gpin(pin, is_set)
+
+@setHook(HOOK_10MS)
+def tick10ms():
+    buttons_tick10ms()
+
+def button_event(index, gesture):
+    """Gesture callback from Buttons module"""
+    led = LED_TUPLE[index]
+    if gesture == GESTURE_PRESS:
+        writePin(led, not readPin(led))
+    elif gesture == GESTURE_DOUBLE:
+        pulsePin(led, 500, True)
+    elif gesture == GESTURE_LONG:
+        writePin(led, False)
@@ -0,0 +1,236 @@
+# Copyright (C) 2015 Synapse Wireless, Inc.
+# Subject to your agreement of the disclaimer set forth below, permission is given by Synapse Wireless, Inc. ("Synapse") to you to freely modify, redistribute or include this SNAPpy code in any program. The purpose of this code is to help you understand and learn about SNAPpy by code examples.
+# BY USING ALL OR ANY PORTION OF THIS SNAPPY CODE, YOU ACCEPT AND AGREE TO THE BELOW DISCLAIMER. If you do not accept or agree to the below disclaimer, then you may not use, modify, or distribute this SNAPpy code.
+# THE CODE IS PROVIDED UNDER THIS LICENSE ON AN "AS IS" BASIS, WITHOUT WARRANTY OF ANY KIND, EITHER EXPRESSED OR IMPLIED, INCLUDING, WITHOUT LIMITATION, WARRANTIES THAT THE COVERED CODE IS FREE OF DEFECTS, MERCHANTABLE, FIT FOR A PARTICULAR PURPOSE OR NON-INFRINGING. THE ENTIRE RISK AS TO THE QUALITY AND PERFORMANCE OF THE COVERED CODE IS WITH YOU. SHOULD ANY COVERED CODE PROVE DEFECTIVE IN ANY RESPECT, YOU (NOT THE INITIAL DEVELOPER OR ANY OTHER CONTRIBUTOR) ASSUME THE COST OF ANY NECESSARY SERVICING, REPAIR OR CORRECTION. UNDER NO CIRCUMSTANCES WILL SYNAPSE BE LIABLE TO YOU, OR ANY OTHER PERSON OR ENTITY, FOR ANY LOSS OF USE, REVENUE OR PROFIT, LOST OR DAMAGED DATA, OR OTHER COMMERCIAL OR ECONOMIC LOSS OR FOR ANY DAMAGES WHATSOEVER RELATED TO YOUR USE OR RELIANCE UPON THE SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGES OR IF SUCH DAMAGES ARE FORESEEABLE. THIS DISCLAIMER OF WARRANTY AND LIABILITY CONSTITUTES AN ESSENTIAL PART OF THIS LICENSE. NO USE OF ANY COVERED CODE IS AUTHORIZED HEREUNDER EXCEPT UNDER THIS DISCLAIMER.
+
+'''SNAPpy Remote Control Panel Demo
+    Sample SNAPpy script to demonstrate using the SN173 switches as a remote control panel.
+    Debounced switch gestures (see Buttons.py) are mapped to RPC calls on other nodes.
+    Each target (a node, or multicast) has its own rate limit: at most one call per hold-off, however
+    many switches send to it. While a target is holding off, each switch keeps only its latest
+    gesture, and waiting switches are served in turn when the hold-off expires.
+    Unicast calls go through the remote node's built-in callback(), which returns to remote_ackNS for
+    switch N and call sequence bit S. The bit flips with each new call (not with retries), so a late
+    acknowledgment for a superseded call cannot clear the call that replaced it.
+    The switch's LED stays lit until the acknowledgment arrives, and the call is retried if none comes.
+    This script is intended to be used with the SN173 evaluation boards.
+'''
+from SN173 import *
+from Buttons import *
+
+# IronMan head node address (edit for your install), and multicast marker
+HEAD_ADDR = '\x00\x00\x01'
+MCAST = ''
+# Multicasts here go to the rangers (calibration_mode), so use the management group that every
+# node keeps: a multicast plan (web_app/mcast_planner.py) gives only heads the control group.
+MCAST_GROUP = 1
+MCAST_TTL = 2
+
+# Call targets, each rate limited separately
+TARGETS = (HEAD_ADDR, MCAST)
+T_HEAD = 0
+T_MCAST = 1
+
+# Remote calls: (target, function, argument) for each switch and gesture,
+# indexed by switch * 3 + (gesture - 1). None = no action.
+REMOTE_MAP = ((T_HEAD, 'sleep_head', False), None, (T_HEAD, 'sleep_head', True),              # S1
+              (T_HEAD, 'set_coordinated', True), None, (T_HEAD, 'set_coordinated', False),    # S2
+              None, None, None,                                                               # S3
+              (T_MCAST, 'calibration_mode', False), None, (T_MCAST, 'calibration_mode', True))  # S4
+
+# Acknowledgment callbacks, indexed by switch * 2 + call sequence bit
+ACK_FUNCS = ('remote_ack00', 'remote_ack01', 'remote_ack10', 'remote_ack11',
+             'remote_ack20', 'remote_ack21', 'remote_ack30', 'remote_ack31')
+
+# Timing, in 100ms ticks
+HOLDOFF_TICKS = 5    # Minimum spacing between calls to one target; also the acknowledgment timeout
+MAX_RETRIES = 2
+USE_ACK = True       # False = plain unicast rpc(), no acknowledgment or retry
+
+# Per-switch state, packed in one integer:
+#   bit 6 = call sequence, bits 4-5 = pending gesture, bits 2-3 = gesture awaiting ack, bits 0-1 = retries
+RS_SEQ_SHIFT = 6
+RS_PEND_SHIFT = 4
+RS_SENT_SHIFT = 2
+RS_RETRY_MASK = 0x03
+
+# Per-target state, packed in one integer:
+#   bits 8-10 = switch awaiting ack + 1 (0 = none), bits 0-7 = hold-off ticks
+TS_WAIT_SHIFT = 8
+TS_TIMER_MASK = 0xFF
+
+remote_state0 = remote_state1 = remote_state2 = remote_state3 = 0
+target_state0 = target_state1 = 0
+remote_next = 0     # Switch to consider first when a target's hold-off expires
+
+# Run start-up function
+@setHook(HOOK_STARTUP)
+def start_up():
+    buttons_init(('remote_gesture', 'remote_gesture', 'remote_gesture', 'remote_gesture'))
+
+    i = 0
+    while i < len(LED_TUPLE):
+        setPinDir(LED_TUPLE[i], True)
+        writePin(LED_TUPLE[i], False)
+        i += 1
+
+@setHook(HOOK_GPIN)
+def pin_event(pin, is_set):
+    buttons_gpin(pin, is_set)
+
+@setHook(HOOK_10MS)
+def tick10ms():
+    buttons_tick10ms()
+
+@setHook(HOOK_100MS)
+def tick100ms():
+    global target_state0, target_state1
+    target_state0 = target_step(T_HEAD, target_state0)
+    target_state1 = target_step(T_MCAST, target_state1)
+
+def remote_gesture(index, gesture):
+    """Gesture callback from Buttons module: queue (or coalesce) the mapped remote call"""
+    entry = REMOTE_MAP[index * 3 + gesture - 1]
+    if entry is None:
+        return
+    st = get_remote_state(index)
+    set_remote_state(index, (st & ~(0x03 << RS_PEND_SHIFT)) | (gesture << RS_PEND_SHIFT))
+    target = entry[0]
+    set_target_state(target, target_send_ready(target, get_target_state(target)))
+
+def target_step(target, ts):
+    """Advance hold-off/retry timing for one target. Returns new state."""
+    timer = ts & TS_TIMER_MASK
+    if timer == 0:
+        # Idle: pending gestures for an idle target are sent as they arrive
+        return ts
+    timer -= 1
+    ts = (ts & ~TS_TIMER_MASK) | timer
+    if timer:
+        return ts
+
+    waiting = ts >> TS_WAIT_SHIFT
+    if waiting:
+        index = waiting - 1
+        st = get_remote_state(index)
+        sent = (st >> RS_SENT_SHIFT) & 0x03
+        if sent and REMOTE_MAP[index * 3 + sent - 1][0] == target:
+            retries = st & RS_RETRY_MASK
+            if retries < MAX_RETRIES and not (st >> RS_PEND_SHIFT) & 0x03:
+                # No acknowledgment: resend, unless a newer gesture supersedes it
+                remote_call(index, sent)
+                set_remote_state(index, st + 1)
+                return ts | HOLDOFF_TICKS
+            set_remote_state(index, st & ~((0x03 << RS_SENT_SHIFT) | RS_RETRY_MASK))
+            writePin(LED_TUPLE[index], False)
+        ts = 0
+    return target_send_ready(target, ts)
+
+def target_send_ready(target, ts):
+    """If target's hold-off has expired, send the next switch's pending gesture for it. Returns new state."""
+    global remote_next
+    if ts & TS_TIMER_MASK:
+        return ts
+    n = 0
+    while n < 4:
+        # Start after the last switch served, so one busy switch cannot starve the others
+        i = (remote_next + n) % 4
+        st = get_remote_state(i)
+        pend = (st >> RS_PEND_SHIFT) & 0x03
+        if pend and REMOTE_MAP[i * 3 + pend - 1][0] == target:
+            remote_next = (i + 1) % 4
+            if TARGETS[target] == MCAST or not USE_ACK:
+                # Multicast calls are not acknowledged
+                remote_call(i, pend)
+                set_remote_state(i, st & ~(0x03 << RS_PEND_SHIFT))
+                return HOLDOFF_TICKS
+            # Awaiting ack replaces any earlier call from this switch, under the next sequence bit
+            set_remote_state(i, (pend << RS_SENT_SHIFT) | (~st & (1 << RS_SEQ_SHIFT)))
+            remote_call(i, pend)
+            writePin(LED_TUPLE[i], True)
+            return ((i + 1) << TS_WAIT_SHIFT) | HOLDOFF_TICKS
+        n += 1
+    return ts
+
+def remote_call(index, gesture):
+    entry = REMOTE_MAP[index * 3 + gesture - 1]
+    addr = TARGETS[entry[0]]
+    if addr == MCAST:
+        mcastRpc(MCAST_GROUP, MCAST_TTL, entry[1], entry[2])
+    elif not USE_ACK:
+        rpc(addr, entry[1], entry[2])
+    else:
+        seq = (get_remote_state(index) >> RS_SEQ_SHIFT) & 1
+        rpc(addr, 'callback', ACK_FUNCS[index * 2 + seq], entry[1], entry[2])
+
+def remote_acked(index, seq):
+    """Acknowledgment (via callback) of switch index's call with sequence bit seq"""
+    st = get_remote_state(index)
+    sent = (st >> RS_SENT_SHIFT) & 0x03
+    if not sent or (st >> RS_SEQ_SHIFT) & 1 != seq:
+        return
+    target = REMOTE_MAP[index * 3 + sent - 1][0]
+    if rpcSourceAddr() != TARGETS[target]:
+        return
+    set_remote_state(index, st & ~((0x03 << RS_SENT_SHIFT) | RS_RETRY_MASK))
+    writePin(LED_TUPLE[index], False)
+    # Keep the target's hold-off running; it is no longer awaiting this switch
+    ts = get_target_state(target)
+    if ts >> TS_WAIT_SHIFT == index + 1:
+        set_target_state(target, ts & TS_TIMER_MASK)
+
+def remote_ack00(result):
+    remote_acked(0, 0)
+
+def remote_ack01(result):
+    remote_acked(0, 1)
+
+def remote_ack10(result):
+    remote_acked(1, 0)
+
+def remote_ack11(result):
+    remote_acked(1, 1)
+
+def remote_ack20(result):
+    remote_acked(2, 0)
+
+def remote_ack21(result):
+    remote_acked(2, 1)
+
+def remote_ack30(result):
+    remote_acked(3, 0)
+
+def remote_ack31(result):
+    remote_acked(3, 1)
+
+def get_remote_state(index):
+    if index == 0:
+        return remote_state0
+    elif index == 1:
+        return remote_state1
+    elif index == 2:
+        return remote_state2
+    return remote_state3
+
+def set_remote_state(index, st):
+    global remote_state0, remote_state1, remote_state2, remote_state3
+    if index == 0:
+        remote_state0 = st
+    elif index == 1:
+        remote_state1 = st
+    elif index == 2:
+        remote_state2 = st
+    else:
+        remote_state3 = st
+
+def get_target_state(target):
+    if target == T_HEAD:
+        return target_state0
+    return target_state1
+
+def set_target_state(target, ts):
+    global target_state0, target_state1
+    if target == T_HEAD:
+        target_state0 = ts
+    else:
+        target_state1 = ts
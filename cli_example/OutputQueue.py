@@ -0,0 +1,95 @@
+"""Deferred STDIO output, drained at the rate the UART can take
+    Output is queued as tuples of constant lines (printed as-is, so include any "\r\n"), plus one
+    pending call-by-name for output that must be formatted when sent. Call outq_drain() from a
+    periodic hook; it sends at most one line per call, and only while UART0 has free TX buffers,
+    so long output never stalls the script or other hooks.
+"""
+
+from synapse.sysInfo import *
+
+OUTQ_TX_BUSY = 2    # Hold output while this many UART0 TX buffers are in use
+OUTQ_SLOTS = 4
+
+# Ring of queued line tuples
+outq_0 = outq_1 = outq_2 = outq_3 = None
+outq_head = 0       # Slot being drained
+outq_count = 0
+outq_line = 0       # Next line within head slot
+outq_call = None    # Function name to call once the lines queued before it are sent
+outq_call_after = 0 # Slots still to drain before outq_call
+
+# Statistics
+outq_deferred = 0   # Drain ticks held off because UART0 was busy
+outq_dropped = 0    # Requests dropped because the queue was full
+
+def outq_lines(lines):
+    """Queue a tuple of constant lines. Returns False (and counts a drop) if queue is full."""
+    global outq_0, outq_1, outq_2, outq_3, outq_count, outq_dropped
+    if outq_count >= OUTQ_SLOTS:
+        outq_dropped += 1
+        return False
+    slot = (outq_head + outq_count) % OUTQ_SLOTS
+    if slot == 0:
+        outq_0 = lines
+    elif slot == 1:
+        outq_1 = lines
+    elif slot == 2:
+        outq_2 = lines
+    else:
+        outq_3 = lines
+    outq_count += 1
+    return True
+
+def outq_defer(func):
+    """Call func (by name) once currently queued output is sent. Returns False (and counts a drop) if one is pending.
+       func runs from outq_drain() before any lines queued after it, so it must print directly: checking
+       outq_busy() there would defer it again, behind those lines.
+    """
+    global outq_call, outq_call_after, outq_dropped
+    if outq_call is not None:
+        outq_dropped += 1
+        return False
+    outq_call = func
+    outq_call_after = outq_count
+    return True
+
+def outq_busy():
+    """True if output should be queued rather than printed directly"""
+    return outq_count or outq_call is not None or getStat(STAT_DS_UART0_TX_BUFFERS) >= OUTQ_TX_BUSY
+
+def outq_slot(slot):
+    if slot == 0:
+        return outq_0
+    elif slot == 1:
+        return outq_1
+    elif slot == 2:
+        return outq_2
+    return outq_3
+
+def outq_drain():
+    """Send next line of queued output, if UART0 has room. Call from a periodic hook."""
+    global outq_head, outq_count, outq_line, outq_call, outq_call_after, outq_deferred
+    if not outq_count and outq_call is None:
+        return
+    if getStat(STAT_DS_UART0_TX_BUFFERS) >= OUTQ_TX_BUSY:
+        outq_deferred += 1
+        return
+
+    if outq_call is not None and outq_call_after == 0:
+        func = outq_call
+        outq_call = None
+        func()
+    else:
+        lines = outq_slot(outq_head)
+        print lines[outq_line],
+        outq_line += 1
+        if outq_line >= len(lines):
+            outq_line = 0
+            outq_head = (outq_head + 1) % OUTQ_SLOTS
+            outq_count -= 1
+            if outq_call_after:
+                outq_call_after -= 1
+
+def outq_stats():
+    """Report deferred/dropped output counts"""
+    print "\r\ndeferred=", outq_deferred, " dropped=", outq_dropped
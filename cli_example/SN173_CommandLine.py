@@ -9,12 +9,18 @@
     Connect a virtual com port and open a connection at 38,400 baud, N,8,1.
     
     NOTE:  This script captures UART0 for the CLI.
+
+    Batch mode (for host scripts): enter 'batch 1'. Echo and prompts are turned off, and each line may
+    hold several ';'-separated commands. Each line gets one reply line of "err:result;" entries, where
+    err is RPC_OK/RPC_ERR_EMPTY/RPC_ERR_ARGS. A block of lines framed by '{' and '}' replies on a single
+    line, ended at '}'. Send 'batch 0' to return to interactive mode.
 '''
 
 from synapse.switchboard import *
 from synapse.sysInfo import *
 from SN173 import *
 from AtmelTemperature import *
+from OutputQueue import *
 
 @setHook(HOOK_STARTUP)
 def start_up():
@@ -24,38 +30,133 @@ def start_up():
     flowControl(0, False)
 
     stdin_event('?')
+
+# Batch mode state
+batch_mode = False
+in_block = False
+
+# str_to_rpc() result codes
+RPC_OK = 0
+RPC_ERR_EMPTY = 1
+RPC_ERR_ARGS = 2
+rpc_err = RPC_OK
  
 @setHook(HOOK_STDIN)    
 def stdin_event(data):
     ''' Process command line input '''
-    global cmd, arg
+    if batch_mode:
+        run_batch(data)
+        return
 
     if data == '?':
         help()
     elif data[0:4] == 'echo':
-        print
+        newline()
         echo(data[5:])
     elif len(data):
-        ret = None
-        print
+        newline()
         
         # Parse string for function and arguments
         ret = str_to_rpc(data)
-        
-        if ret != None:
-            print " => ", ret
+        show_result(ret)
             
-    print "\r\n>",
+    if not batch_mode:
+        outq_lines(PROMPT)
+
+# Interactive output that has to wait behind queued output. Deferred print_* calls run from the
+# drain, in order, so they print directly rather than checking outq_busy() (and deferring) again.
+cli_ret = None
+cli_err = RPC_OK
+echo_text = ''
+NEWLINE = ("\r\n",)
+
+def newline():
+    """Start command output on a new line, in order with any queued output"""
+    if outq_busy():
+        outq_lines(NEWLINE)
+    else:
+        print
+
+def show_result(ret):
+    """Print a command's result (or argument error), deferred while output is queued"""
+    global cli_ret, cli_err
+    if rpc_err != RPC_ERR_ARGS and ret == None:
+        return
+    cli_ret = ret
+    cli_err = rpc_err
+    if outq_busy():
+        outq_defer('print_result')
+    else:
+        print_result()
+
+def print_result():
+    if cli_err == RPC_ERR_ARGS:
+        print "Too many arguments (max ", MAX_ARGS, ")"
+    else:
+        print " => ", cli_ret
+
+@setHook(HOOK_10MS)
+def tick10ms():
+    # Send queued CLI output at the rate UART0 can take it
+    outq_drain()
+
+def run_batch(data):
+    """Run ';'-separated commands, replying with compact "err:result;" entries"""
+    global in_block
+    if data == '{':
+        in_block = True
+        return
+    if data == '}':
+        in_block = False
+        print
+        return
+    
+    n = len(data)
+    start = 0
+    i = 0
+    while i <= n:
+        if i == n or ord(data[i]) == 59:   # ';'
+            if i > start:
+                ret = str_to_rpc(data[start:i])
+                if ret != None:
+                    print rpc_err, ':', ret, ';',
+                else:
+                    print rpc_err, ':;',
+            start = i + 1
+        i += 1
+
+    if not in_block:
+        print
+
+def batch(do_batch):
+    """Enter/leave batch mode: no echo or prompts, compact replies"""
+    global batch_mode, in_block
+    batch_mode = int(do_batch) != 0
+    in_block = False
+    stdinMode(0, not batch_mode)
 
 #----- The following are some simple functions for us to easily invoke from CLI -----
 
+PROMPT = ("\r\n>",)
+HELP_LINES = ("\r\nThis sample CLI can call any SNAPpy function.\r\n",
+              "Enter a function name, followed by up to 4 space-separated arguments.\r\n",
+              "Numeric arguments are passed as integers.\r\n",
+              "\r\n",
+              "Example: 'led 1 1' will turn on LED1\r\n",
+              "'batch 1' enters batch mode: ';'-separated commands, compact replies, no echo\r\n",
+              "'outq_stats' reports deferred/dropped output\r\n")
+
 def help():
-    print "\r\nThis sample CLI can call any SNAPpy function."
-    print "Enter a function name [' ' + optional argument] [' ' + optional argument]"
-    print
-    print "Example: 'led 1 1' will turn on LED1"
+    # Long output is queued, and drained by tick10ms()
+    outq_lines(HELP_LINES)
 
 def ver():
+    if outq_busy():
+        outq_defer('print_ver')
+    else:
+        print_ver()
+
+def print_ver():
     print "SNAP v", getInfo(SI_TYPE_VERSION_MAJOR), '.', getInfo(SI_TYPE_VERSION_MINOR), '.', getInfo(SI_TYPE_VERSION_BUILD),
     if getInfo(8) == 1:
         print " with AES-128"
@@ -68,45 +169,94 @@ def led(led, pinState):
     writePin(LED_TUPLE[led], int(pinState))
 
 def echo(text):
-    print text
+    global echo_text
+    echo_text = text
+    if outq_busy():
+        outq_defer('print_echo')
+    else:
+        print_echo()
+
+def print_echo():
+    print echo_text
     
 def temperature():
+    if outq_busy():
+        outq_defer('print_temperature')
+    else:
+        print_temperature()
+
+def print_temperature():
     degC = read_internal_temp()/10
     tenthsC = read_internal_temp()%10
     print degC, '.',tenthsC, ' degrees C'
 
 # String parser
+MAX_ARGS = 4
+
 def str_to_rpc(string):
+    """Tokenize 'func [arg1 ... arg4]' in a single pass, then invoke func.
+       Tokens are located by index and sliced once each; numeric args are converted while
+       scanning and passed as integers.
+    """
+    global rpc_err
+    n = len(string)
+    func = None
+    argc = 0
+    a1 = a2 = a3 = a4 = None
     i = 0
-    func = ''
-    a1 = ''
-    a2 = ''
-    arg_status = 0
-    while i < len(string):
-        strEnd = 0
-        if string[i] == ' ' or i == len(string)-1:
-            if i == len(string)-1:
-                strEnd = 1
-            if func  == '':
-                func = string[:i+strEnd]
-                string = string[i+1:]
-                i = 0
-            elif a1  == '':
-                a1 = string[:i+strEnd]
-                string = string[i+1:]
-                arg_status += 1
-                i = 0
-            elif a2  == '':
-                a2 = string[:i+strEnd]
-                string = string[i+1:]
-                arg_status += 1
-                i = 0
+    while i < n:
+        c = ord(string[i])
+        if c == 32:
+            # Skip separator
+            i += 1
         else:
-            i+=1
-    if arg_status == 0:
-        retval = func()
-    elif arg_status == 1:
-        retval = func(a1)
-    elif arg_status == 2:
-        retval = func(a1,a2)
-    return retval
\ No newline at end of file
+            # Scan token, accumulating integer value as we go
+            start = i
+            neg = c == 45    # '-'
+            if neg:
+                i += 1
+            num = 0
+            is_num = i < n and ord(string[i]) != 32    # A lone '-' is a string
+            while i < n:
+                c = ord(string[i])
+                if c == 32:
+                    break
+                if c < 48 or c > 57:
+                    is_num = False
+                else:
+                    num = num * 10 + c - 48
+                i += 1
+
+            if func is None:
+                func = string[start:i]
+            else:
+                if is_num:
+                    val = -num if neg else num
+                else:
+                    val = string[start:i]
+                argc += 1
+                if argc == 1:
+                    a1 = val
+                elif argc == 2:
+                    a2 = val
+                elif argc == 3:
+                    a3 = val
+                elif argc == 4:
+                    a4 = val
+                else:
+                    rpc_err = RPC_ERR_ARGS
+                    return None
+
+    if func is None:
+        rpc_err = RPC_ERR_EMPTY
+        return None
+    rpc_err = RPC_OK
+    if argc == 0:
+        return func()
+    elif argc == 1:
+        return func(a1)
+    elif argc == 2:
+        return func(a1, a2)
+    elif argc == 3:
+        return func(a1, a2, a3)
+    return func(a1, a2, a3, a4)
@@ -0,0 +1,13 @@
+"""bridge_stick - SNAP Connect bridge node (serial/USB stick) for the IronMan demo
+   The bridge is a multicast hop between app_server and the mesh. Its forwarding mask has to
+   include the telemetry and control groups, or ranger reports never reach SNAP Connect and
+   control multicasts never leave the stick. web_app/mcast_planner.py plans its masks, and
+   nv_provision.py pushes them (nv_settings provides nv_report/nv_push/nv_commit).
+"""
+
+from nv_settings import *
+
+@setHook(HOOK_STARTUP)
+def init():
+    # Pick up any planned multicast group masks (may reboot once)
+    apply_mcast_plan()
@@ -1,6 +1,9 @@
 """iron_head - Animatronic Iron Man head, controlled by Synapse SN173 protoboard"""
 
 from pan_tilt import *
+from node_stats import *
+from probe import *
+from led_effects import *
 
 # 100ms tick count intervals
 boot_countdown = 20   # before servos enabled
@@ -29,12 +32,27 @@ SENSOR_LOCS = ((-20, 70),  # Sensor 0 pan,tilt
 
 sensor_drive_speed = 40
 
+# Idle "seek" sequence: (pan, tilt, speed, dwell), dwell in 10ms ticks after arrival
+SEEK_PATH = ((PAN_CENTER, TILT_LEVEL, 20, 440),
+             (PAN_LEFT, TILT_UP, 20, 200),
+             (PAN_RIGHT, TILT_UP, 20, 400),
+             (PAN_CENTER, TILT_LEVEL, 20, 400))
+
 @setHook(HOOK_STARTUP)
 def init():
+    # Pick up any planned multicast group masks (may reboot once)
+    apply_mcast_plan()
+    
     # Initialize pan/tilt assy, and LEDs
     pt_init()
     init_leds()
     
+    # LED patterns run from hardware PWM, unless the 16-bit servo backend owns Timer1/Timer3
+    if not SERVO_PWM16:
+        led_fx_init()
+        led_effect(0, FX_HEARTBEAT, 10, 0)          # Comforting 100ms blink each second
+        led_effect(1, FX_BLINK, 5, boot_countdown)  # Blink while counting down to servo enable
+    
     # Reset distance accumulator
     accum_dist(0, 0, True)
     
@@ -52,6 +70,7 @@ def sleep_head(do_sleep):
 @setHook(HOOK_10MS)
 def tick10ms():
     pt_tick10ms()
+    led_tick10ms()
     
 def init_leds():
     i = 0
@@ -64,7 +83,9 @@ def init_leds():
 @setHook(HOOK_1S)
 def tick1s():
     # Comforting LED blink
-    pulsePin(LED1, 100, True)
+    if SERVO_PWM16:
+        pulsePin(LED1, 100, True)
+    stats_tick1s()
 
 @setHook(HOOK_100MS)
 def tick100ms():    
@@ -88,7 +109,8 @@ def tick100ms():
     
     if boot_countdown:
         boot_countdown -= 1
-        pulsePin(LED2, 50, True)
+        if SERVO_PWM16:
+            pulsePin(LED2, 50, True)
         if boot_countdown == 0:
             enable_servos(True)
 
@@ -97,6 +119,10 @@ def dist(index, val):
     if val < SENSE_DISTANCE:
         accum_dist(index, val, False)
 
+def dist_trace(index, val, tick, echo_ms):
+    """Traced distance report (sonic_ranger TRACE_DIST)"""
+    dist(index, val)
+
 def min_avg(index, sum, num):
     """Adjust current sensor minimum-distance avg/index"""
     global min_val, min_index
@@ -129,18 +155,10 @@ def check_sensors():
         # While idle, execute "seek" sequence, then sleep
         idle_count += 1
         if idle_count == 8:
-            print "idle: center1"
-            drive_to(PAN_CENTER, TILT_LEVEL, 20)
-        elif idle_count == 30:
-            print "idle: left-up"
-            drive_to(PAN_LEFT, TILT_UP, 20)
-        elif idle_count == 40:
-            print "idle: right-up"
-            drive_to(PAN_RIGHT, TILT_UP, 20)
-        elif idle_count == 60:
-            print "idle: center2"
-            drive_to(PAN_CENTER, TILT_LEVEL, 20)
-        elif idle_count == 80:
+            print "idle: seek"
+            run_path(SEEK_PATH)
+        elif idle_count == 9:
+            # Seek path has completed
             print "idle: sleep"
             sleep_head(True)
         
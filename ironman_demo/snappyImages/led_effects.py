@@ -0,0 +1,119 @@
+"""led_effects - Hardware PWM LED patterns for SN173
+LEDs are dimmed by Timer1/Timer3 fast PWM, so a pattern costs one table lookup per step rather than a
+Python-timed pulsePin() for every blink. Patterns are strings of brightness bytes (0-255), stepped
+from led_tick10ms().
+  Channel 0 = LED1 = OC1B
+  Channel 1 = LED2 = OC1A
+  Channel 2 = LED3 = OC3A
+(LED4 is not on a PWM pin.)
+
+Note: Uses Timer1 and Timer3, so can't be combined with input capture (sonic_ranger) or pan_tilt's
+      16-bit servo backend.
+"""
+
+from atmega128rfa1_timers import *
+
+# Patterns: one brightness byte per step
+FX_OFF = "\x00"
+FX_ON = "\xff"
+FX_BLINK = "\xff\x00"
+FX_HEARTBEAT = "\xff\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+FX_DOUBLE_BLINK = "\xff\x00\xff\x00\x00\x00\x00\x00\x00\x00"
+FX_BREATHE = "\x00\x01\x04\x0a\x14\x24\x3a\x56\x7a\xa4\xd6\xff\xd6\xa4\x7a\x56\x3a\x24\x14\x0a\x04\x01"
+
+# Per-channel state: pattern, position (index << 8 | ticks to next step), config (ticks per step << 8 | repeats left)
+fx_pat0 = fx_pat1 = fx_pat2 = FX_OFF
+fx_pos0 = fx_pos1 = fx_pos2 = 0
+fx_cfg0 = fx_cfg1 = fx_cfg2 = 0
+
+def led_fx_init():
+    """Set Timer1/Timer3 for 8-bit fast PWM at ~1kHz (250kHz / 256). Outputs stay off until lit."""
+    timer_init(TMR1, WGM_FASTPWM8, CLK_FOSC_DIV64, 0)
+    timer_init(TMR3, WGM_FASTPWM8, CLK_FOSC_DIV64, 0)
+
+def led_effect(chan, pattern, ticks_per_step, repeats):
+    """Run pattern on channel, one step per ticks_per_step (x10ms). repeats=0 loops forever,
+       otherwise the LED is turned off after the pattern has run repeats times.
+    """
+    global fx_pat0, fx_pat1, fx_pat2, fx_pos0, fx_pos1, fx_pos2, fx_cfg0, fx_cfg1, fx_cfg2
+    led_level(chan, ord(pattern[0]))
+    pos = (1 << 8) | ticks_per_step
+    cfg = (ticks_per_step << 8) | repeats
+    if chan == 0:
+        fx_pat0 = pattern
+        fx_pos0 = pos
+        fx_cfg0 = cfg
+    elif chan == 1:
+        fx_pat1 = pattern
+        fx_pos1 = pos
+        fx_cfg1 = cfg
+    else:
+        fx_pat2 = pattern
+        fx_pos2 = pos
+        fx_cfg2 = cfg
+
+def led_tick10ms():
+    """Call this from 10ms timer hook"""
+    global fx_pos0, fx_pos1, fx_pos2, fx_cfg0, fx_cfg1, fx_cfg2
+    if fx_pos0:
+        fx_pos0 = led_step(0, fx_pat0, fx_pos0, fx_cfg0)
+        if not fx_pos0:
+            fx_cfg0 = 0
+    if fx_pos1:
+        fx_pos1 = led_step(1, fx_pat1, fx_pos1, fx_cfg1)
+        if not fx_pos1:
+            fx_cfg1 = 0
+    if fx_pos2:
+        fx_pos2 = led_step(2, fx_pat2, fx_pos2, fx_cfg2)
+        if not fx_pos2:
+            fx_cfg2 = 0
+
+def led_step(chan, pattern, pos, cfg):
+    """Advance channel by one tick. Returns new position, 0 when finished."""
+    ticks = (pos & 0xFF) - 1
+    index = pos >> 8
+    if ticks:
+        return (index << 8) | ticks
+
+    if index >= len(pattern):
+        # End of pattern: loop, or count down repeats
+        repeats = cfg & 0xFF
+        if repeats == 1:
+            led_level(chan, 0)
+            return 0
+        if repeats:
+            led_fx_set_repeats(chan, repeats - 1)
+        index = 0
+
+    level = ord(pattern[index])
+    prev = ord(pattern[index - 1]) if index else ord(pattern[len(pattern) - 1])
+    if level != prev:
+        led_level(chan, level)
+    return ((index + 1) << 8) | (cfg >> 8)
+
+def led_fx_set_repeats(chan, repeats):
+    global fx_cfg0, fx_cfg1, fx_cfg2
+    if chan == 0:
+        fx_cfg0 = (fx_cfg0 & 0xFF00) | repeats
+    elif chan == 1:
+        fx_cfg1 = (fx_cfg1 & 0xFF00) | repeats
+    else:
+        fx_cfg2 = (fx_cfg2 & 0xFF00) | repeats
+
+def led_level(chan, level):
+    """Set channel brightness (0-255). Zero disconnects PWM, so the LED is fully off."""
+    if chan == 0:
+        tmr = TMR1
+        ocr = OCRxB
+    elif chan == 1:
+        tmr = TMR1
+        ocr = OCRxA
+    else:
+        tmr = TMR3
+        ocr = OCRxA
+
+    if level:
+        set_tmr_ocr(tmr, ocr, level)
+        set_tmr_output(tmr, ocr, TMR_OUTP_CLR)
+    else:
+        set_tmr_output(tmr, ocr, TMR_OUTP_OFF)
@@ -0,0 +1,84 @@
+"""node_stats - Periodic runtime statistics report
+Samples a configurable subset of getStat()/getInfo() values, and multicasts them as one packed
+report every N seconds:
+    node_stats(stat_mask, info_mask, packed)
+where bit i of stat_mask selects getStat(i), bit i of info_mask selects getInfo(SI_SMALL_STRS_REMAINING + i),
+and packed holds one byte per selected value, in bit order. Forwarding counters are sent as deltas since
+the previous report; all values are clipped to 255.
+Call stats_tick1s() from the HOOK_1S handler. Reporting is off until set_stats() gives an interval.
+"""
+
+from synapse.sysInfo import *
+
+STATS_GROUP = 1
+STATS_TTL = 2
+
+# Buffer levels, forwarding counts, and string/route table headroom
+DEFAULT_STAT_MASK = 0x7FFF
+DEFAULT_INFO_MASK = 0x0F
+
+stats_interval = 0   # seconds, 0=off
+stats_countdown = 0
+stat_mask = DEFAULT_STAT_MASK
+info_mask = DEFAULT_INFO_MASK
+
+# Previous forwarding counts, for deltas
+prev_fwd_uni = 0
+prev_fwd_ps_uni = 0
+prev_fwd_x = 0
+prev_fwd_ps_x = 0
+
+def set_stats(interval, stats, infos):
+    """Report selected stats every interval seconds (0=off)"""
+    global stats_interval, stats_countdown, stat_mask, info_mask
+    stats_interval = interval
+    stats_countdown = interval
+    stat_mask = stats
+    info_mask = infos
+
+def stats_tick1s():
+    """Call this from 1s timer hook"""
+    global stats_countdown
+    if stats_countdown:
+        stats_countdown -= 1
+        if not stats_countdown:
+            stats_countdown = stats_interval
+            send_stats()
+
+def stat_delta(id):
+    """Counter delta since last report, for forwarding counters. Other stats are returned as-is."""
+    global prev_fwd_uni, prev_fwd_ps_uni, prev_fwd_x, prev_fwd_ps_x
+    cur = getStat(id)
+    if id == STAT_RADIO_FORWARDED_UNICASTS:
+        delta = cur - prev_fwd_uni
+        prev_fwd_uni = cur
+    elif id == STAT_PACKET_SERIAL_FORWARDED_UNICASTS:
+        delta = cur - prev_fwd_ps_uni
+        prev_fwd_ps_uni = cur
+    elif id == STAT_RADIO_FORWARDED_XCASTS:
+        delta = cur - prev_fwd_x
+        prev_fwd_x = cur
+    elif id == STAT_PACKET_SERIAL_FORWARDED_XCASTS:
+        delta = cur - prev_fwd_ps_x
+        prev_fwd_ps_x = cur
+    else:
+        delta = cur
+    return delta
+
+def clip8(val):
+    return 255 if val > 255 else 0 if val < 0 else val
+
+def send_stats():
+    """Sample selected stats and multicast them as one packed report"""
+    packed = ''
+    i = 0
+    while i < 15:
+        if stat_mask & (1 << i):
+            packed += chr(clip8(stat_delta(i)))
+        i += 1
+    i = 0
+    while i < 4:
+        if info_mask & (1 << i):
+            packed += chr(clip8(getInfo(SI_SMALL_STRS_REMAINING + i)))
+        i += 1
+    mcastRpc(STATS_GROUP, STATS_TTL, 'node_stats', stat_mask, info_mask, packed)
@@ -1,26 +1,121 @@
 """NV settings initialization"""
 from synapse.nvparams import *
 
+# User NV parameter ids. All scripts allocate their ids here, so they can't collide.
+NV_NODE_INDEX = NV_USER_MIN_ID + 0   # sonic_ranger
+NV_PAN_LL = NV_USER_MIN_ID + 8       # pan_tilt (moved from +0..+5, which overlapped NV_NODE_INDEX)
+NV_PAN_UL = NV_USER_MIN_ID + 9
+NV_PAN_TRIM = NV_USER_MIN_ID + 10
+NV_TILT_LL = NV_USER_MIN_ID + 11
+NV_TILT_UL = NV_USER_MIN_ID + 12
+NV_TILT_TRIM = NV_USER_MIN_ID + 13
+NV_PLAN_INTEREST = NV_USER_MIN_ID + 14         # Multicast plan (see web_app/mcast_planner.py)
+NV_PLAN_FORWARD = NV_USER_MIN_ID + 15
+NV_PLAN_TELEMETRY_GROUP = NV_USER_MIN_ID + 16
+NV_PLAN_TELEMETRY_TTL = NV_USER_MIN_ID + 17
+NV_USER_IDS = (NV_NODE_INDEX, NV_PAN_LL, NV_PAN_UL, NV_PAN_TRIM, NV_TILT_LL, NV_TILT_UL, NV_TILT_TRIM,
+               NV_PLAN_INTEREST, NV_PLAN_FORWARD, NV_PLAN_TELEMETRY_GROUP, NV_PLAN_TELEMETRY_TTL)
+
+# Telemetry multicast schema entries: (id, default, min, max)
+NVS_TELEMETRY_GROUP = (NV_PLAN_TELEMETRY_GROUP, 1, 1, 0x4000)
+NVS_TELEMETRY_TTL = (NV_PLAN_TELEMETRY_TTL, 2, 1, 15)
+
 def init_nv_settings(mcast_proc, mcast_fwd, cs, ca, cd):
-    """Set mcast processed groups, forwarding groups, CSMA settings, etc."""
+    """Set mcast processed groups, forwarding groups, CSMA settings, etc.
+       Group masks planned for this node (NV_PLAN_INTEREST/NV_PLAN_FORWARD) take precedence.
+    """
     global _needs_reboot
     _needs_reboot = False
 
     # RPC CRC
     check_nv(NV_FEATURE_BITS_ID, 0x011F)
-    check_nv(NV_GROUP_INTEREST_MASK_ID, mcast_proc)
-    check_nv(NV_GROUP_FORWARDING_MASK_ID, mcast_fwd)
+    check_nv(NV_GROUP_INTEREST_MASK_ID, planned_nv(NV_PLAN_INTEREST, mcast_proc))
+    check_nv(NV_GROUP_FORWARDING_MASK_ID, planned_nv(NV_PLAN_FORWARD, mcast_fwd))
     check_nv(NV_CARRIER_SENSE_ID, cs)
     check_nv(NV_COLLISION_AVOIDANCE_ID, ca)
     check_nv(NV_COLLISION_DETECT_ID, cd)
-    
+
+    # Only one reboot, after all changed values have been written
+    if _needs_reboot:
+        reboot()
+
+def apply_mcast_plan():
+    """Apply planned group masks, for scripts that otherwise keep default NV settings"""
+    global _needs_reboot
+    _needs_reboot = False
+
+    val = loadNvParam(NV_PLAN_INTEREST)
+    if val is not None:
+        check_nv(NV_GROUP_INTEREST_MASK_ID, val)
+    val = loadNvParam(NV_PLAN_FORWARD)
+    if val is not None:
+        check_nv(NV_GROUP_FORWARDING_MASK_ID, val)
+
     if _needs_reboot:
         reboot()
 
+def planned_nv(param, default):
+    val = loadNvParam(param)
+    return default if val is None else val
+
 def check_nv(param, val):
-    global _needs_reboot    
+    global _needs_reboot
     if loadNvParam(param) != val:
         saveNvParam(param, val)
         _needs_reboot = True
 
-    
\ No newline at end of file
+def check_nv_ids():
+    """Return first user NV id allocated more than once, or None"""
+    i = 0
+    while i < len(NV_USER_IDS):
+        j = i + 1
+        while j < len(NV_USER_IDS):
+            if NV_USER_IDS[i] == NV_USER_IDS[j]:
+                return NV_USER_IDS[i]
+            j += 1
+        i += 1
+    return None
+
+def nv_load(entry):
+    """Load user NV param for schema entry (id, default, min, max).
+       Missing or out-of-range values yield the default.
+    """
+    val = loadNvParam(entry[0])
+    if val is None or val < entry[2] or val > entry[3]:
+        return entry[1]
+    return val
+
+def nv_migrate(old_id, entry):
+    """One-shot move of a user NV param from a retired id to schema entry's id.
+       Only acts while the new id is unset; the old id is cleared afterwards.
+    """
+    if loadNvParam(entry[0]) is not None:
+        return
+    val = loadNvParam(old_id)
+    if val is not None:
+        nv_store(entry, None, val)
+        saveNvParam(old_id, None)
+
+def nv_store(entry, cur, val):
+    """Validate and save user NV param for schema entry, writing flash only if changed from cur.
+       Returns the value now in effect.
+    """
+    if val < entry[2] or val > entry[3]:
+        return cur
+    if val != cur:
+        saveNvParam(entry[0], val)
+    return val
+
+#---- Remote provisioning (see web_app/nv_provision.py) ----
+def nv_report(id):
+    """Report NV param to caller, as nv_val(id, val)"""
+    rpc(rpcSourceAddr(), 'nv_val', id, loadNvParam(id))
+
+def nv_push(id, val):
+    """Save NV param and acknowledge to caller, as nv_ack(id). Takes effect after nv_commit()."""
+    saveNvParam(id, val)
+    rpc(rpcSourceAddr(), 'nv_ack', id)
+
+def nv_commit():
+    """Apply pushed NV params"""
+    reboot()
@@ -4,6 +4,12 @@ Hardware is an SN173 driving two servos from PWM channels:
   Upper connector (antenna end) is "Tilt" = OC2A, pin E3, I/O 4
   Lower connector is "Pan" = OC0B, pin G5, I/O 37
 
+Alternate 16-bit backend (SERVO_PWM16 = True) drives the servos from hardware PWM instead:
+  "Tilt" = OC3C, pin E5, I/O 21
+  "Pan" = OC1C, pin B7, I/O 7
+  Timers 1 and 3 run at 2MHz with TOP=ICR for a true 50Hz frame and 0.5us pulse resolution,
+  with no per-tick one-shot firing required.
+
 Servo control:
   Standard servos respond to "pulse position modulation".
   Pulses are sent at 50Hz
@@ -12,18 +18,32 @@ Servo control:
 
 from SN173 import *
 from atmega128rfa1_timers import *
-from synapse.nvparams import *
+from nv_settings import *
+
+# NV schema entries: (id, default, min, max)
+NVS_PAN_LL = (NV_PAN_LL, -100, -100, 200)
+NVS_PAN_UL = (NV_PAN_UL, 200, -100, 200)
+NVS_PAN_TRIM = (NV_PAN_TRIM, 0, -1000, 1000)
+NVS_TILT_LL = (NV_TILT_LL, -100, -100, 200)
+NVS_TILT_UL = (NV_TILT_UL, 200, -100, 200)
+NVS_TILT_TRIM = (NV_TILT_TRIM, 0, -1000, 1000)
 
-NV_PAN_LL = NV_USER_MIN_ID + 0
-NV_PAN_UL = NV_USER_MIN_ID + 1
-NV_PAN_TRIM = NV_USER_MIN_ID + 2
-NV_TILT_LL = NV_USER_MIN_ID + 3
-NV_TILT_UL = NV_USER_MIN_ID + 4
-NV_TILT_TRIM = NV_USER_MIN_ID + 5
+# Ids these params had before allocation moved to nv_settings (+0..+5 overlapped NV_NODE_INDEX).
+# Heads calibrated under the old ids are migrated once, by migrate_nv().
+NV_OLD_IDS = (NV_USER_MIN_ID + 0, NV_USER_MIN_ID + 1, NV_USER_MIN_ID + 2,
+              NV_USER_MIN_ID + 3, NV_USER_MIN_ID + 4, NV_USER_MIN_ID + 5)
+
+# Select servo timer backend: False = 8-bit TMR0 one-shot/TMR2 PWM, True = 16-bit TMR1/TMR3 PWM
+SERVO_PWM16 = False
 
 # I/O pin definitions
 TILT_IO = 4
 PAN_IO = 37
+TILT16_IO = 21
+PAN16_IO = 7
+
+# 16-bit PWM frame: 20ms at 2MHz = 40000 counts, so TOP=39999 (0x9C3F, written as signed 16-bit)
+PWM16_TOP = -25537
 
 # Pulse widths in microseconds
 pan_pulse_width = 1500
@@ -37,6 +57,15 @@ drive_tilt = None
 speed_pan = 0
 speed_tilt = 0
 
+# Coordinated moves step both axes so they arrive on the same tick
+coordinated = True
+drive_steps = 0   # 10ms ticks remaining in coordinated move
+
+# Waypoint sequence: tuple of (pan, tilt, speed, dwell) entries, dwell in 10ms ticks after arrival
+wp_path = None
+wp_index = 0
+wp_dwell = 0
+
 # Trim values, thousandths of full-scale (+-)
 trim_tilt = 0
 trim_pan = 0
@@ -47,23 +76,42 @@ pan_ul = 200
 tilt_ll = -100
 tilt_ul = 200
 
-# Calculated Atmel timer count for one-shot
+# Calculated Atmel timer counts, cached to skip redundant register writes
 tmr0_oneshot_trig = 0
+tmr2_match = None
+pan_match16 = None
+tilt_match16 = None
 
 def pt_init():
     """Initialize pan_tilt controller"""
-    setPinDir(TILT_IO, True)
-    writePin(TILT_IO, False)
-    setPinDir(PAN_IO, True)
-    writePin(PAN_IO, False)
+    if SERVO_PWM16:
+        setPinDir(TILT16_IO, True)
+        writePin(TILT16_IO, False)
+        setPinDir(PAN16_IO, True)
+        writePin(PAN16_IO, False)
+    else:
+        setPinDir(TILT_IO, True)
+        writePin(TILT_IO, False)
+        setPinDir(PAN_IO, True)
+        writePin(PAN_IO, False)
     init_timers()
+    migrate_nv()
     load_limits()
     load_trim()
+    dup = check_nv_ids()
+    if dup is not None:
+        print "NV id collision: ", dup
     
 def drive_to(pan, tilt, speed):
     """Drive servos to designated postions at given speed in deg/sec
     """
-    global drive_pan, drive_tilt, speed_pan, speed_tilt
+    global wp_path
+    wp_path = None
+    start_drive(pan, tilt, speed)
+
+def start_drive(pan, tilt, speed):
+    """Begin move toward pan/tilt position. Speed applies to the axis with furthest to travel."""
+    global drive_pan, drive_tilt, speed_pan, speed_tilt, drive_steps
     ticks_per_degree = 33  # pulse_width delta per degree = 6000/180
 
     #print "drive_to(", pan, ",",tilt,")"
@@ -79,34 +127,66 @@ def drive_to(pan, tilt, speed):
 
     drive_pan = percent2pulse(pan)
     drive_tilt = percent2pulse(tilt)
-    sign = -1 if drive_pan < pan_pulse_width else +1
-    speed_pan = sign * speed_ticks
-    sign = -1 if drive_tilt < tilt_pulse_width else +1
-    speed_tilt = sign * speed_ticks
+    
+    if coordinated:
+        # Both axes share one step count, sized by the longer travel
+        speed_pan = speed_tilt = 0
+        delta = abs(drive_pan - pan_pulse_width)
+        tilt_delta = abs(drive_tilt - tilt_pulse_width)
+        if tilt_delta > delta:
+            delta = tilt_delta
+        drive_steps = (delta + speed_ticks - 1) / speed_ticks
+    else:
+        drive_steps = 0
+        sign = -1 if drive_pan < pan_pulse_width else +1
+        speed_pan = sign * speed_ticks
+        sign = -1 if drive_tilt < tilt_pulse_width else +1
+        speed_tilt = sign * speed_ticks
+
+def set_coordinated(do_coord):
+    """Select coordinated (straight-line) or independent per-axis moves"""
+    global coordinated
+    coordinated = do_coord
+
+def run_path(path):
+    """Drive through a tuple of (pan, tilt, speed, dwell) waypoints without further commands.
+       Dwell is the number of 10ms ticks to hold after arriving at each waypoint.
+    """
+    global wp_path, wp_index, wp_dwell
+    wp_path = path
+    wp_index = 0
+    wp_dwell = 0
+
+def step_path():
+    """Advance waypoint sequence once current move and dwell are complete"""
+    global wp_path, wp_index, wp_dwell
+    if wp_dwell:
+        wp_dwell -= 1
+    elif wp_index < len(wp_path):
+        wp = wp_path[wp_index]
+        start_drive(wp[0], wp[1], wp[2])
+        wp_dwell = wp[3]
+        wp_index += 1
+    else:
+        wp_path = None
 
 def set_pan_limits(ll, ul):
     global pan_ll, pan_ul
-    pan_ll = ll
-    pan_ul = ul
-    saveNvParam(NV_PAN_LL, pan_ll)
-    saveNvParam(NV_PAN_UL, pan_ul)
+    pan_ll = nv_store(NVS_PAN_LL, pan_ll, ll)
+    pan_ul = nv_store(NVS_PAN_UL, pan_ul, ul)
     
 def set_tilt_limits(ll, ul):
     global tilt_ll, tilt_ul
-    tilt_ll = ll
-    tilt_ul = ul
-    saveNvParam(NV_TILT_LL, tilt_ll)
-    saveNvParam(NV_TILT_UL, tilt_ul)
+    tilt_ll = nv_store(NVS_TILT_LL, tilt_ll, ll)
+    tilt_ul = nv_store(NVS_TILT_UL, tilt_ul, ul)
     
 def set_pan_trim(val):
     global trim_pan
-    trim_pan = val
-    saveNvParam(NV_PAN_TRIM, trim_pan)
+    trim_pan = nv_store(NVS_PAN_TRIM, trim_pan, val)
     
 def set_tilt_trim(val):
     global trim_tilt
-    trim_tilt = val
-    saveNvParam(NV_TILT_TRIM, trim_tilt)
+    trim_tilt = nv_store(NVS_TILT_TRIM, trim_tilt, val)
     
 def set_position(pan, tilt):
     """Set immediate position of pan/tilt servos"""
@@ -127,6 +207,20 @@ def dump_state():
     
 def init_timers():
     """Initialize Atmega timers used for precision servo pulse timing"""
+    global tmr0_oneshot_trig, tmr2_match, pan_match16, tilt_match16
+    # Invalidate cached counts, so next set_pulsewidths() writes both registers
+    tmr0_oneshot_trig = 0
+    tmr2_match = None
+    pan_match16 = None
+    tilt_match16 = None
+    
+    if SERVO_PWM16:
+        # Timers 1 and 3 are 16-bits, so a plain fast-PWM with TOP=ICR gives an exact 50Hz frame.
+        # CLK_FOSC_DIV8 yields a 2MHz (0.5us) tick. Outputs stay off until enable_servos().
+        timer_init(TMR1, WGM_FASTPWM16_TOP_ICR, CLK_FOSC_DIV8, PWM16_TOP)
+        timer_init(TMR3, WGM_FASTPWM16_TOP_ICR, CLK_FOSC_DIV8, PWM16_TOP)
+        return
+    
     # Timer0 is only 8-bits, so we are going with "one-shot" mode rather than PWM in order to get better resolution
     # of pulse widths at <100Hz pulse rate.
     # Use CLK_FOSC_DIV256 for a clock freq of 16M/256, yeilding a 16us tick. With 8-bit counters that gives 4.096ms 
@@ -144,46 +238,69 @@ def init_timers():
     
 def set_pulsewidths():
     """Calculate and set counter-match values based on desired pulsewidths"""
-    global tmr0_oneshot_trig
+    set_pan_pulse()
+    set_tilt_pulse()
+
+def set_pan_pulse():
+    """Set TMR0 one-shot match for pan pulsewidth. Register is only written when the 8-bit count changes."""
+    global tmr0_oneshot_trig, pan_match16
+
+    if SERVO_PWM16:
+        # 2 counts per microsecond
+        match = pan_pulse_width << 1
+        if match != pan_match16:
+            pan_match16 = match
+            set_tmr_ocr(TMR1, OCRxC, match)
+        return
 
-    # Trigger value for oneshot timer, given 16us per tick.
+    # Trigger value for oneshot timer, given 16us per tick (shift rather than divide).
     # This is one count below the counter 'match' setting which determines actual pulsewidth.
-    tmr0_oneshot_trig = -1 - pan_pulse_width / 16
-    set_tmr8_ocr(TMR0, OCR0B, tmr0_oneshot_trig + 1)
+    trig = -1 - (pan_pulse_width >> 4)
+    if trig != tmr0_oneshot_trig:
+        tmr0_oneshot_trig = trig
+        set_tmr8_ocr(TMR0, OCR0B, trig + 1)
+
+def set_tilt_pulse():
+    """Set TMR2 match for tilt pulsewidth. Register is only written when the 8-bit count changes."""
+    global tmr2_match, tilt_match16
+
+    if SERVO_PWM16:
+        match = tilt_pulse_width << 1
+        if match != tilt_match16:
+            tilt_match16 = match
+            set_tmr_ocr(TMR3, OCRxC, match)
+        return
 
     # Timer2 is set to 31us per tick. Negative width yeilds counts high prior to 0xFFFF.
-    tmr2_match = -tilt_pulse_width / 31
-    set_tmr8_ocr(TMR2, OCR0A, tmr2_match)
+    match = -tilt_pulse_width / 31
+    if match != tmr2_match:
+        tmr2_match = match
+        set_tmr8_ocr(TMR2, OCR0A, match)
     
 def fire_oneshots():
     # Generate pulse, by setting count just below match (will end at overflow)
     set_tmr8_count(TMR0, tmr0_oneshot_trig)
 
+def migrate_nv():
+    """Carry limits and trims saved under the old ids over to the new ones"""
+    nv_migrate(NV_OLD_IDS[0], NVS_PAN_LL)
+    nv_migrate(NV_OLD_IDS[1], NVS_PAN_UL)
+    nv_migrate(NV_OLD_IDS[2], NVS_PAN_TRIM)
+    nv_migrate(NV_OLD_IDS[3], NVS_TILT_LL)
+    nv_migrate(NV_OLD_IDS[4], NVS_TILT_UL)
+    nv_migrate(NV_OLD_IDS[5], NVS_TILT_TRIM)
+
 def load_limits():
     global pan_ll, pan_ul, tilt_ll, tilt_ul
-    
-    lim = loadNvParam(NV_PAN_LL)
-    if lim is not None:
-        pan_ll = lim
-    lim = loadNvParam(NV_PAN_UL)
-    if lim is not None:
-        pan_ul = lim
-    lim = loadNvParam(NV_TILT_LL)
-    if lim is not None:
-        tilt_ll = lim
-    lim = loadNvParam(NV_TILT_UL)
-    if lim is not None:
-        tilt_ul = lim
+    pan_ll = nv_load(NVS_PAN_LL)
+    pan_ul = nv_load(NVS_PAN_UL)
+    tilt_ll = nv_load(NVS_TILT_LL)
+    tilt_ul = nv_load(NVS_TILT_UL)
         
 def load_trim():
     global trim_pan, trim_tilt
-        
-    trim = loadNvParam(NV_TILT_TRIM)
-    if trim is not None:
-        trim_tilt = trim
-    trim = loadNvParam(NV_PAN_TRIM)
-    if trim is not None:
-        trim_pan = trim
+    trim_tilt = nv_load(NVS_TILT_TRIM)
+    trim_pan = nv_load(NVS_PAN_TRIM)
 
 def pt_tick10ms():
     """Call this from 10ms timer hook"""
@@ -191,32 +308,50 @@ def pt_tick10ms():
     alt20ms = not alt20ms
     if servos_enabled:
         go_drive()
+        if wp_path is not None and not (drive_steps or speed_pan or speed_tilt):
+            step_path()
         
-        # Fire one-shot servo controls at 50Hz rate
-        if alt20ms:
+        # Fire one-shot servo controls at 50Hz rate (16-bit PWM backend generates its own pulses)
+        if alt20ms and not SERVO_PWM16:
             fire_oneshots()
 
 def go_drive():
-    global speed_pan, speed_tilt
+    global speed_pan, speed_tilt, drive_steps
     global pan_pulse_width, tilt_pulse_width
-    pulse_changed = False
+    pan_changed = False
+    tilt_changed = False
     
+    # Coordinated move: cover an equal share of remaining travel each tick, landing both axes together
+    if drive_steps:
+        step = (drive_pan - pan_pulse_width) / drive_steps
+        if step:
+            pan_changed = True
+            pan_pulse_width += step
+        step = (drive_tilt - tilt_pulse_width) / drive_steps
+        if step:
+            tilt_changed = True
+            tilt_pulse_width += step
+        drive_steps -= 1
+
     # If we're driving, then drive
     if speed_pan:
-        pulse_changed = True
+        pan_changed = True
         pan_pulse_width += speed_pan
         if abs(pan_pulse_width - drive_pan) <= abs(speed_pan):
             pan_pulse_width = drive_pan
             speed_pan = 0
     if speed_tilt:
-        pulse_changed = True
+        tilt_changed = True
         tilt_pulse_width += speed_tilt
         if abs(tilt_pulse_width - drive_tilt) <= abs(speed_tilt):
             tilt_pulse_width = drive_tilt
             speed_tilt = 0
     
-    if pulse_changed:
-        set_pulsewidths()
+    # Only touch the timer for the axis that moved
+    if pan_changed:
+        set_pan_pulse()
+    if tilt_changed:
+        set_tilt_pulse()
     
 def abs(val):
     return -val if val < 0 else val
@@ -226,19 +361,25 @@ def percent2pulse(pct):
     return 1000 + (pct * 10)
 
 def is_driving():
-    return speed_tilt or speed_pan
+    return speed_tilt or speed_pan or drive_steps or wp_path is not None
 
 def drive_stop():
     """Abort in-progress driving"""
-    global speed_pan, speed_tilt
-    speed_pan = speed_tilt = 0
+    global speed_pan, speed_tilt, drive_steps, wp_path
+    speed_pan = speed_tilt = drive_steps = 0
+    wp_path = None
 
 def enable_servos(do_enable):
     """Stop pulsing the servos, allowing them to relax"""
     global servos_enabled
     servos_enabled = do_enable
     
-    if do_enable:
+    if SERVO_PWM16:
+        # Non-inverting PWM: high from BOTTOM until match
+        mode = TMR_OUTP_CLR if do_enable else TMR_OUTP_OFF
+        set_tmr_output(TMR1, OCRxC, mode)
+        set_tmr_output(TMR3, OCRxC, mode)
+    elif do_enable:
         set_tmr8_output(TMR2, OCR0A, TMR_OUTP_SET)
     else:
         set_tmr8_output(TMR2, OCR0A, TMR_OUTP_OFF)
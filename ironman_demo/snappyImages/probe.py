@@ -0,0 +1,10 @@
+"""probe - Echo responder for mesh latency/loss probing (see web_app/probe_mesh.py)"""
+
+from synapse.sysInfo import *
+
+def probe(seq, pad):
+    """Echo probe back to sender, as probe_ack(seq, ttl_remaining, pad).
+       For multicast probes, ttl_remaining lets the sender compute hop count.
+    """
+    ttl = getInfo(SI_MULTI_PKT_TTL_ID) if getInfo(SI_RPC_IS_MULTICAST_ID) else 0
+    rpc(rpcSourceAddr(), 'probe_ack', seq, ttl, pad)
@@ -7,6 +7,8 @@ Developed with Synapse SN173 Protoboard.
 from SN173 import *
 from atmega128rfa1_timers import *
 from nv_settings import *
+from node_stats import *
+from probe import *
 
 # HC-SR04 pin assignments. Note that two "Input Capture Pins" are connected to the single "ECHO" output
 TRIG = 10   # Pad G4
@@ -21,24 +23,33 @@ ICP_COUNT_OFFSET = 76  # Determined using 'calibration_mode' as described below
 # audio interference. Total number of sonic-rangers in network controls round robin cycle-rate.
 # In this scenario, nodes are assigned node_index between 0 and NUM_SENSORS-1.
 NUM_SENSORS = 4
-NV_NODE_INDEX = NV_USER_MIN_ID + 0
+NVS_NODE_INDEX = (NV_NODE_INDEX, 0, 0, NUM_SENSORS - 1)  # (id, default, min, max)
 node_index = None
 
+# Distance report multicast group and TTL (planned via NV, defaults group 1, TTL 2)
+dist_group = 1
+dist_ttl = 2
+
+# Latency tracing: report as dist_trace(index, val, tick, echo_ms) instead of dist(index, val).
+# All receivers (rangers, heads, app_server) must run an image with dist_trace.
+TRACE_DIST = False
+trig_ms = 0
+
 reply_countdown = 0
 trig_countdown = 0
 
 @setHook(HOOK_STARTUP)
 def init():
-    global node_index
+    global node_index, dist_group, dist_ttl
     
     init_nv_settings(1, 0, True, False, False)
     init_hcsr04()
     init_leds()
     init_input_capture()
     
-    node_index = loadNvParam(NV_NODE_INDEX)
-    if node_index is None:
-        node_index = 0
+    node_index = nv_load(NVS_NODE_INDEX)
+    dist_group = nv_load(NVS_TELEMETRY_GROUP)
+    dist_ttl = nv_load(NVS_TELEMETRY_TTL)
         
     # If we're the "master" node, get the party started.
     if node_index == 0:
@@ -70,8 +81,7 @@ def init_input_capture():
 def set_node_index(i):
     """Assign this node an integer index, controlling sequencing of ultrasonic pulses"""
     global node_index
-    node_index = i
-    saveNvParam(NV_NODE_INDEX, node_index)
+    node_index = nv_store(NVS_NODE_INDEX, node_index, i)
 
 def trig():
     pulsePin(TRIG, -100, True)
@@ -89,8 +99,10 @@ def calibration_mode(do_enable):
     
 def start_ranging(do_reply):
     """Begin ranging operation. Should complete within 20ms"""
-    global reply_countdown
+    global reply_countdown, trig_ms
     
+    trig_ms = getMs()
+
     # Clear both counters. The time delta between the next two lines of code determines the calibration offset needed.
     set_tmr_count(TMR1, 0)
     set_tmr_count(TMR3, 0)
@@ -129,7 +141,10 @@ def tick10ms():
         reply_countdown -= 1
         if reply_countdown == 0:
             # Send ranging distance report
-            mcastRpc(1, 2, 'dist', node_index, last_dist_meas())
+            if TRACE_DIST:
+                send_dist_trace()
+            else:
+                mcastRpc(dist_group, dist_ttl, 'dist', node_index, last_dist_meas())
             # If we're the master node, reschedule
             if node_index == 0:
                 start_trig_countdown()
@@ -140,6 +155,16 @@ def dist(index, val):
         # Our countdown is calculated using node=0 as "master" report
         start_trig_countdown()
 
+def dist_trace(index, val, tick, echo_ms):
+    """Traced ranging distance report"""
+    dist(index, val)
+
+def send_dist_trace():
+    """Send distance report with trace stamps: our ms tick at send, and ms from echo capture to send"""
+    now = getMs()
+    echo_ms = (now - trig_ms) - get_icp_val(TMR3) / 250  # ICP3 counts at 250kHz from trigger to echo end
+    mcastRpc(dist_group, dist_ttl, 'dist_trace', node_index, last_dist_meas(), now, echo_ms)
+
 def start_trig_countdown():
     """Schedule based on node_index, about 50ms apart"""
     global trig_countdown
@@ -150,3 +175,4 @@ def start_trig_countdown():
 def tick1s():
     # Comforting LED blink - pulse LED indicating our node_index
     pulsePin(LED_TUPLE[node_index], 100, True)
+    stats_tick1s()
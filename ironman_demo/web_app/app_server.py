@@ -1,8 +1,16 @@
 # (c) Copyright 2015, Synapse Wireless, Inc.
 """Application Server for IronMan demo
    A web server based on Tornado, integrated with SNAP Connect.
+
+   --event-loop selects what runs underneath Tornado's IOLoop:
+     tornado  Tornado's default (its own epoll/select loop on Python 2; asyncio on Tornado 5+ with Python 3)
+     asyncio  asyncio's default loop (Python 3)
+     uvloop   asyncio with the uvloop policy (Python 3, pip install uvloop)
+   SNAP Connect's scheduler, the WebSocket hub and the HTTP handlers all run on the chosen loop.
+   See bench_server.py to compare them with the same simulated traffic.
 """
 
+import tornado.concurrent
 import tornado.escape
 import tornado.ioloop
 import tornado.web
@@ -12,12 +20,40 @@ import snapconnect
 from snapconnect import snap
 from apy import ioloop_scheduler
 
-import asyncore
+import downsample
+import ioloop_watchdog
+import latency_trace
+import mcast_planner
+import metrics
+import sampling_profiler
+import snap_bridges
+import snap_capture
+
+import argparse
+import binascii
+import collections
+import json
 import os
 import logging
+import time
 
 log = logging.getLogger(__file__)
 
+try:
+    import asyncore
+except ImportError:
+    asyncore = None  # Removed in Python 3.12; nothing to poll unless SNAP Connect registers dispatchers
+
+try:
+    text_type = unicode
+except NameError:
+    text_type = str  # Python 3
+
+EVENT_LOOPS = ('tornado', 'asyncio', 'uvloop')
+
+# Tornado < 6 needs @asynchronous to keep a request open after get() returns
+web_asynchronous = getattr(tornado.web, 'asynchronous', lambda method: method)
+
 # SNAP Connect settings
 #serial_conn = snap.SERIAL_TYPE_SNAPSTICK100
 serial_conn = snap.SERIAL_TYPE_SNAPSTICK200
@@ -25,6 +61,48 @@ serial_conn = snap.SERIAL_TYPE_SNAPSTICK200
 serial_port = 0
 #serial_port = 'COM3'
 snap_addr = '\xff\xb6\x06'
+# SNAP bridges: (name, SNAP address, SNAP Connect open method, args). Each bridge is a separate
+# SNAP Connect instance, so needs its own address covered by the license.
+snap_bridge_config = [('stick0', snap_addr, 'open_serial', (serial_conn, serial_port)),
+                      #('stick1', '\xff\xb6\x07', 'open_serial', (serial_conn, 1)),
+                      #('tcp0', '\xff\xb6\x08', 'connect_tcp', ('192.168.1.50',)),
+                      #('listen', '\xff\xb6\x09', 'accept_tcp', ()),
+                     ]
+# Multicast groups processed by this gateway, and the group/TTL for control multicasts to heads.
+# Without a plan (see mcast_planner.py and --mcast-plan), control goes out on the management group.
+group_interest_mask = mcast_planner.GROUP_MGMT | mcast_planner.GROUP_TELEMETRY
+control_group = mcast_planner.GROUP_MGMT
+control_ttl = 2
+
+# Field names for node_stats reports, in mask bit order (see snappyImages/node_stats.py)
+STAT_NAMES = ('null_tx_bufs', 'uart0_rx_bufs', 'uart0_tx_bufs', 'uart1_rx_bufs', 'uart_tx_bufs',
+              'transparent_rx_bufs', 'transparent_tx_bufs', 'pkt_serial_rx_bufs', 'pkt_serial_tx_bufs',
+              'radio_rx_bufs', 'radio_tx_bufs', 'radio_fwd_unicasts', 'pkt_serial_fwd_unicasts',
+              'radio_fwd_xcasts', 'pkt_serial_fwd_xcasts')
+INFO_NAMES = ('small_strs_remaining', 'medium_strs_remaining', 'route_table_size', 'routes_in_table')
+STATS_HISTORY = 360  # reports kept per node
+
+# Distance stream subscription levels: every report, or min/max/mean summaries over a period (seconds)
+DIST_LEVEL_RAW = 'raw'
+DIST_ROLLUPS = (('1s', 1), ('10s', 10))
+DIST_LEVELS = (DIST_LEVEL_RAW,) + tuple(level for level, period in DIST_ROLLUPS)
+
+# Server metrics, served on /metrics
+metrics_registry = metrics.Registry('ironman_')
+WS_WAITERS = metrics_registry.gauge('ws_waiters', 'Connected browser WebSockets')
+WS_MSGS_IN = metrics_registry.counter('ws_messages_in_total', 'Messages received from browsers')
+WS_MSGS_OUT = metrics_registry.counter('ws_messages_out_total', 'Messages written to browsers')
+WS_ENCODE_SECONDS = metrics_registry.histogram('ws_encode_seconds', 'JSON encode time per broadcast message')
+WS_WRITE_ERRORS = metrics_registry.counter('ws_write_errors_total', 'Failed WebSocket writes')
+SNAP_CALLINS = metrics_registry.counter('snap_callins_total', 'SNAP RPC call-ins', 'func')
+SNAP_DUPLICATES = metrics_registry.counter('snap_duplicate_callins_total', 'Call-ins dropped as heard via another bridge')
+SNAP_BRIDGE_OUT = metrics_registry.counter('snap_bridge_outbound_total', 'Outbound RPCs per bridge', 'bridge')
+SNAP_BRIDGE_CONNECTED = metrics_registry.gauge('snap_bridge_connected', 'Bridge link up (1) or down (0)', 'bridge')
+SNAP_RECONNECTS = metrics_registry.counter('snap_reconnect_attempts_total', 'Bridge reconnect attempts', 'bridge')
+SNAP_OUTBOUND_QUEUED = metrics_registry.gauge('snap_outbound_queued', 'Outbound RPCs held while no bridge is connected')
+SNAP_OUTBOUND_DROPPED = metrics_registry.counter('snap_outbound_dropped_total', 'Outbound RPCs dropped from a full queue')
+SNAP_POLL_SECONDS = metrics_registry.histogram('snap_poll_seconds', 'SNAP Connect poll (asyncore + internals) time')
+IOLOOP_LAG_SECONDS = metrics_registry.histogram('ioloop_lag_seconds', 'IOLoop timer lateness')
 
 
 class WebSocketHandler(tornado.websocket.WebSocketHandler):
@@ -32,9 +110,16 @@ class WebSocketHandler(tornado.websocket.WebSocketHandler):
         Messages TO the browser are encoded "rpc-like" as
             {'kind' : 'funcName', 'args' : params}
         Messages FROM the browser are translated to RPC calls and invoked on
-        our SNAP Connect instance.
+        our SNAP Connect instance, except for ws_* commands, which are
+        handled per connection (e.g. {'funcname' : 'set_level', 'args' : ['1s']}).
+        Distance stream level is chosen with /wshub?level=raw|1s|10s or set_level.
+        Connections receive every message unless they subscribe to topics: a funcname, or
+        funcname/index for one sensor (e.g. /wshub?topics=report_dist/2, or subscribe/unsubscribe).
     '''
     waiters = set()    # Browser connections
+    levels = dict((level, set()) for level in DIST_LEVELS)  # Distance stream level -> browser connections
+    topics = collections.defaultdict(set)  # Topic -> subscribed browser connections
+    unfiltered = set() # Browser connections with no topic subscriptions, which receive everything
 
     def allow_draft76(self):
         '''Allow older browser websocket versions'''
@@ -42,97 +127,468 @@ class WebSocketHandler(tornado.websocket.WebSocketHandler):
     
     def open(self):
         WebSocketHandler.waiters.add(self)
+        WS_WAITERS.set(len(WebSocketHandler.waiters))
+        self.level = None
+        level = self.get_argument('level', DIST_LEVEL_RAW)
+        if level not in WebSocketHandler.levels:
+            log.error('Unknown distance stream level: %s, using %s' % (level, DIST_LEVEL_RAW))
+            level = DIST_LEVEL_RAW
+        self.ws_set_level(level)
+        self.subscriptions = set()
+        WebSocketHandler.unfiltered.add(self)
+        for topic in self.get_argument('topics', '').split(','):
+            if topic:
+                self.ws_subscribe(str(topic))
+        # Current bridge link state, so the page does not have to wait for a change
+        for bridge in snapCom.bridges:
+            self.write_message(snapCom.bridge_state_message(bridge))
 
     def on_close(self):
         WebSocketHandler.waiters.remove(self)
+        WebSocketHandler.levels.get(self.level, set()).discard(self)
+        WebSocketHandler.unfiltered.discard(self)
+        for topic in list(self.subscriptions):
+            self.ws_unsubscribe(topic)
+        WS_WAITERS.set(len(WebSocketHandler.waiters))
+
+    def ws_subscribe(self, topic):
+        '''Browser command: receive messages for topic (funcname or funcname/index) only'''
+        self.subscriptions.add(topic)
+        WebSocketHandler.topics[topic].add(self)
+        WebSocketHandler.unfiltered.discard(self)
+
+    def ws_unsubscribe(self, topic):
+        '''Browser command: drop a topic. With no topics left, the connection receives everything again.'''
+        self.subscriptions.discard(topic)
+        subscribers = WebSocketHandler.topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(self)
+            if not subscribers:
+                del WebSocketHandler.topics[topic]
+        if not self.subscriptions and self in WebSocketHandler.waiters:
+            WebSocketHandler.unfiltered.add(self)
+
+    def ws_set_level(self, level):
+        '''Browser command: choose distance stream level'''
+        if level not in WebSocketHandler.levels:
+            log.error('Unknown distance stream level: %s' % level)
+            return
+        if self.level:
+            WebSocketHandler.levels[self.level].discard(self)
+        self.level = level
+        WebSocketHandler.levels[level].add(self)
+
+    @classmethod
+    def send_topic(cls, message, index=None, level=None):
+        '''Send message to connections interested in its funcname (and sensor index, if given),
+           limited to those at a distance stream level if given
+        '''
+        func = message['funcname']
+        waiters = cls.unfiltered | cls.topics.get(func, set())
+        if index is not None:
+            waiters |= cls.topics.get('%s/%d' % (func, index), set())
+        if level is not None:
+            waiters &= cls.levels[level]
+        cls.send_updates(message, waiters)
 
     @classmethod
-    def send_updates(cls, message):
-        #log.info("sending message to %d waiters", len(cls.waiters))
-        for waiter in cls.waiters:
+    def send_updates(cls, message, waiters=None):
+        '''Send message to waiters (default all browser connections)'''
+        if waiters is None:
+            waiters = cls.waiters
+        if not waiters:
+            return
+        # Encode once for all waiters, rather than once per write_message()
+        t_start = time.time()
+        message = tornado.escape.json_encode(message)
+        WS_ENCODE_SECONDS.observe(time.time() - t_start)
+        for waiter in waiters:
             try:
                 waiter.write_message(message)
+                WS_MSGS_OUT.inc()
             except:
+                WS_WRITE_ERRORS.inc()
                 log.error("Error sending message", exc_info=True)
 
     def on_message(self, message):
         '''Translate browser message into RPC function call (into local SnapCom object)'''
         #log.info("got message %r", message)
+        WS_MSGS_IN.inc()
         parsed = tornado.escape.json_decode(message)
         try:
-            func = getattr(snapCom, parsed['funcname'])
+            func = getattr(self, 'ws_' + parsed['funcname'], None) or getattr(snapCom, parsed['funcname'])
         except AttributeError:
             log.exception('Browser called unknown function: %s' % str(parsed))
         else:
             try:
-                args = [str(a) if isinstance(a,unicode) else a for a in parsed['args']]
+                args = [str(a) if isinstance(a,text_type) else a for a in parsed['args']]
                 func(*args)
             except:
                 log.exception('Error calling function: %s' % str(parsed))
 
 
+def counted(func, counter):
+    """Wrap an RPC function to count its calls"""
+    def wrapper(*args):
+        counter.inc()
+        return func(*args)
+    return wrapper
+
+
 class SnapCom(object):
     """Snap Connect communication layer"""
     SNAPCONNECT_POLL_INTERVAL = 5 # ms
+    CAPTURE_FLUSH_INTERVAL = 1000 # ms
+    BRIDGE_LOAD_DECAY_INTERVAL = 1000 # ms
+    DEDUPE_WINDOW = 0.05 # seconds; well under the ~200ms ranger report period, so genuine repeats pass
+    OUTBOUND_QUEUE_MAX = 100 # RPCs held while disconnected; oldest are dropped beyond this
+    OUTBOUND_METHODS = ('rpc', 'mcast_rpc', 'mcastRpc', 'dmcast_rpc')  # snap_method calls that send to the mesh
 
-    def __init__(self):
+    def __init__(self, snapconnect=None, capture=None, bridge_config=None):
+        """snapconnect: SNAP Connect instance to use instead of opening bridges (see snap_capture.ReplaySnap)
+           capture: snap_capture.CaptureWriter to record every call-in to
+           bridge_config: list of bridges to open, default snap_bridge_config
+        """
         self.snapRpcFuncs = {'dist' : self.dist,
-                             'send_ws' : self.send_ws
+                             'dist_trace' : self.dist_trace,
+                             'send_ws' : self.send_ws,
+                             'node_stats' : self.node_stats
                             }
-        
+        self.stats = {}  # Node address (hex) -> deque of recent node_stats reports
+        self.tracer = latency_trace.LatencyTracer()
+        self.rollups = [downsample.Rollup(level, period) for level, period in DIST_ROLLUPS]
+
+        for name, func in self.snapRpcFuncs.items():
+            self.snapRpcFuncs[name] = counted(func, SNAP_CALLINS.labels(name))
+
+        if capture:
+            for name, func in self.snapRpcFuncs.items():
+                self.snapRpcFuncs[name] = capture.wrap(name, func, self.source_addr)
+            tornado.ioloop.PeriodicCallback(capture.flush, self.CAPTURE_FLUSH_INTERVAL).start()
+
+        self.connected = False
+        self.current_bridge = None  # Bridge dispatching the current call-in
+        self.outbound_queue = collections.deque()  # (method, args) held while no bridge is connected
+        if snapconnect:
+            bridge = snap_bridges.Bridge('local')
+            bridge.snapconnect = snapconnect
+            bridge.connected = self.connected = True
+            self.bridges = [bridge]
+        else:
+            self.bridges = [self.open_bridge(*config) for config in (bridge_config or snap_bridge_config)]
+        self.snapconnect = self.bridges[0].snapconnect
+        self.dedupe = snap_bridges.CallinDeduper(self.DEDUPE_WINDOW) if len(self.bridges) > 1 else None
+
+        # Tell the Tornado scheduler to call SNAP Connect's internal poll function.
+        tornado.ioloop.PeriodicCallback(self.poll, self.SNAPCONNECT_POLL_INTERVAL).start()
+        tornado.ioloop.PeriodicCallback(self.decay_bridge_load, self.BRIDGE_LOAD_DECAY_INTERVAL).start()
+
+        for rollup in self.rollups:
+            tornado.ioloop.PeriodicCallback(lambda rollup=rollup: self.send_rollup(rollup), rollup.period * 1000).start()
+
+    def open_bridge(self, name, addr, method, args):
+        """Create a SNAP Connect instance and open its link to the mesh"""
+        bridge = snap_bridges.Bridge(name, method, args)
+        funcs = dict((func_name, self.bridge_callin(bridge, func_name, func))
+                     for func_name, func in self.snapRpcFuncs.items())
         cur_dir = os.path.dirname(__file__)
 
         # Create SNAP Connect instance. Note: we are using TornadoWeb's scheduler.
-        self.snapconnect = snap.Snap(license_file = os.path.join(cur_dir, 'SrvLicense.dat'),
-                                     addr = snap_addr,
-                                     scheduler=ioloop_scheduler.IOLoopScheduler.instance(),
-                                     funcs = self.snapRpcFuncs
-                                    )
+        bridge.snapconnect = snap.Snap(license_file = os.path.join(cur_dir, 'SrvLicense.dat'),
+                                       addr = addr,
+                                       scheduler=ioloop_scheduler.IOLoopScheduler.instance(),
+                                       funcs = funcs
+                                      )
+
+        bridge.snapconnect.save_nv_param(snap.NV_GROUP_INTEREST_MASK_ID, group_interest_mask)
+
+        bridge.snapconnect.set_hook(snap.hooks.HOOK_SNAPCOM_OPENED,
+                                    lambda addr_pair, remote_addr: self.on_connected(addr_pair, remote_addr, bridge))
+        bridge.snapconnect.set_hook(snap.hooks.HOOK_SNAPCOM_CLOSED,
+                                    lambda addr_pair, remote_addr: self.on_disconnected(addr_pair, remote_addr, bridge))
+        bridge.snapconnect.set_hook(snap.hooks.HOOK_SERIAL_CLOSE, lambda *args: self.bridge_down(bridge))
 
         # Connect to local SNAP wireless network
-        self.snapconnect.open_serial(serial_conn, serial_port)
-   
-        #self.snapconnect.accept_tcp()
-        
-        self.snapconnect.set_hook(snap.hooks.HOOK_SNAPCOM_OPENED, self.on_connected)
-        self.snapconnect.set_hook(snap.hooks.HOOK_SNAPCOM_CLOSED, self.on_disconnected)
-        
-        # Tell the Tornado scheduler to call SNAP Connect's internal poll function.
-        tornado.ioloop.PeriodicCallback(asyncore.poll, self.SNAPCONNECT_POLL_INTERVAL).start()
-        tornado.ioloop.PeriodicCallback(self.snapconnect.poll_internals, self.SNAPCONNECT_POLL_INTERVAL).start()
+        self.connect_bridge(bridge)
+        return bridge
+
+    def connect_bridge(self, bridge):
+        """Open (or reopen) a bridge's link. Serial opens synchronously; TCP reports via hooks."""
+        if bridge.method == 'open_serial':
+            try:
+                bridge.snapconnect.close_serial(*bridge.args)
+            except Exception:
+                pass  # Not open
+        try:
+            getattr(bridge.snapconnect, bridge.method)(*bridge.args)
+        except Exception as e:
+            log.warning("Bridge %s: %s failed: %s" % (bridge.name, bridge.method, e))
+            self.schedule_reconnect(bridge)
+        else:
+            if bridge.method == 'open_serial':
+                self.bridge_up(bridge)
+
+    def bridge_up(self, bridge):
+        if bridge.retry:
+            tornado.ioloop.IOLoop.instance().remove_timeout(bridge.retry)
+            bridge.retry = None
+        bridge.attempts = 0
+        bridge.connected = self.connected = True
+        SNAP_BRIDGE_CONNECTED.labels(bridge.name).set(1)
+        log.info("Bridge %s connected" % bridge.name)
+        self.send_bridge_state(bridge)
+        self.flush_outbound()
+
+    def bridge_down(self, bridge):
+        if bridge.connected:
+            log.warning("Bridge %s disconnected" % bridge.name)
+        bridge.connected = False
+        self.connected = any(b.connected for b in self.bridges)
+        SNAP_BRIDGE_CONNECTED.labels(bridge.name).set(0)
+        if bridge.reconnects:
+            self.schedule_reconnect(bridge)
+        else:
+            self.send_bridge_state(bridge)
+
+    def schedule_reconnect(self, bridge):
+        if bridge.retry:
+            return
+        delay = bridge.retry_delay()
+        bridge.retry = tornado.ioloop.IOLoop.instance().add_timeout(time.time() + delay,
+                                                                    lambda: self.reconnect(bridge))
+        self.send_bridge_state(bridge, delay)
+
+    def reconnect(self, bridge):
+        bridge.retry = None
+        bridge.attempts += 1
+        SNAP_RECONNECTS.labels(bridge.name).inc()
+        log.info("Bridge %s: reconnect attempt %d" % (bridge.name, bridge.attempts))
+        self.connect_bridge(bridge)
+
+    def bridge_state_message(self, bridge, retry_in=None):
+        if bridge.connected:
+            state = 'connected'
+        elif bridge.retry:
+            state = 'reconnecting'
+        else:
+            state = 'disconnected'
+        return {'funcname' : 'bridge_state', 'args' : (bridge.name, state, retry_in)}
+
+    def send_bridge_state(self, bridge, retry_in=None):
+        """Push a bridge's link state to browsers, as bridge_state(name, state, retry_in_seconds)"""
+        WebSocketHandler.send_topic(self.bridge_state_message(bridge, retry_in))
+
+    def bridge_callin(self, bridge, name, func):
+        """Wrap an RPC function for one bridge: note the bridge, and drop copies heard via another bridge"""
+        def callin(*args):
+            self.current_bridge = bridge
+            if self.dedupe and self.dedupe.is_duplicate((bridge.snapconnect.rpc_source_addr(), name, args), bridge):
+                SNAP_DUPLICATES.inc()
+                return None
+            return func(*args)
+        return callin
+
+    def source_addr(self):
+        """SNAP address of the node making the current call-in"""
+        return (self.current_bridge or self.bridges[0]).snapconnect.rpc_source_addr()
+
+    def send_outbound(self, method, args):
+        """Call a SNAP Connect method on the least-loaded bridge, or queue it until one connects"""
+        if self.connected:
+            getattr(self.outbound(), method)(*args)
+            return
+        if len(self.outbound_queue) >= self.OUTBOUND_QUEUE_MAX:
+            self.outbound_queue.popleft()
+            SNAP_OUTBOUND_DROPPED.inc()
+        self.outbound_queue.append((method, args))
+        SNAP_OUTBOUND_QUEUED.set(len(self.outbound_queue))
+
+    def flush_outbound(self):
+        while self.outbound_queue and self.connected:
+            method, args = self.outbound_queue.popleft()
+            try:
+                getattr(self.outbound(), method)(*args)
+            except:
+                log.exception('Error sending queued %s%r' % (method, args))
+        SNAP_OUTBOUND_QUEUED.set(len(self.outbound_queue))
+
+    def outbound(self):
+        """SNAP Connect instance to send through: the least-loaded connected bridge"""
+        bridge = snap_bridges.least_loaded(self.bridges)
+        bridge.sent()
+        SNAP_BRIDGE_OUT.labels(bridge.name).inc()
+        return bridge.snapconnect
+
+    def rpc(self, addr, func, *args):
+        self.send_outbound('rpc', (addr, func) + args)
+
+    def mcast_rpc(self, group, ttl, func, *args):
+        self.send_outbound('mcast_rpc', (group, ttl, func) + args)
+
+    def control_rpc(self, func, *args):
+        """Browser call-in: multicast a control call to the heads, on the planned control group"""
+        self.mcast_rpc(control_group, control_ttl, func, *args)
+
+    def decay_bridge_load(self):
+        for bridge in self.bridges:
+            bridge.decay()
+
+    def poll(self):
+        t_start = time.time()
+        if asyncore is not None and asyncore.socket_map:
+            asyncore.poll()
+        for bridge in self.bridges:
+            # One failing bridge (e.g. stick unplugged) must not stop the others being polled
+            try:
+                bridge.snapconnect.poll_internals()
+            except Exception:
+                if bridge.connected:
+                    # Logged once: bridge_down() schedules any reconnect, and polls keep failing until then
+                    log.exception('Bridge %s: poll failed' % bridge.name)
+                    self.bridge_down(bridge)
+        SNAP_POLL_SECONDS.observe(time.time() - t_start)
  
     def send_ws(self, func, *args):
         '''SNAPpy call-in to invoke websocket functions'''
         message = {'funcname' : func, 'args' : args}
-        WebSocketHandler.send_updates(message)
+        WebSocketHandler.send_topic(message)
     
     def dist(self, index, val):
         """Distance report call-in from SNAPpy"""
-        self.send_ws('report_dist', index, val)
+        message = {'funcname' : 'report_dist', 'args' : (index, val)}
+        WebSocketHandler.send_topic(message, index, DIST_LEVEL_RAW)
+        for rollup in self.rollups:
+            rollup.add(index, val)
+
+    def send_rollup(self, rollup):
+        """End of a rollup period: send one summary of all sensors to its subscribers"""
+        rows = rollup.flush()
+        if rows:
+            message = {'funcname' : 'report_dist_summary', 'args' : (rollup.period, rows)}
+            WebSocketHandler.send_topic(message, level=rollup.level)
+
+    def dist_trace(self, index, val, tick, echo_ms):
+        """Traced distance report call-in from SNAPpy (sonic_ranger TRACE_DIST)"""
+        trace_id, t_received = self.tracer.received(self.source_addr(), tick, echo_ms)
+        message = {'funcname' : 'report_dist', 'args' : (index, val), 'trace' : trace_id}
+        WebSocketHandler.send_topic(message, index, DIST_LEVEL_RAW)
+        self.tracer.sent(trace_id, t_received)
+        for rollup in self.rollups:
+            rollup.add(index, val)
+
+    def trace_ack(self, trace_id):
+        """Browser call-in: traced report has been painted"""
+        self.tracer.acked(trace_id)
         
+    def node_stats(self, stat_mask, info_mask, packed):
+        """Runtime stats call-in from SNAPpy node_stats module"""
+        values = iter(bytearray(packed))
+        report = {'time' : time.time()}
+        for i, name in enumerate(STAT_NAMES):
+            if stat_mask & (1 << i):
+                report[name] = next(values, None)
+        for i, name in enumerate(INFO_NAMES):
+            if info_mask & (1 << i):
+                report[name] = next(values, None)
+
+        addr = binascii.hexlify(self.source_addr()).decode('ascii')
+        if addr not in self.stats:
+            self.stats[addr] = collections.deque(maxlen=STATS_HISTORY)
+        self.stats[addr].append(report)
+
     def snap_method(self, func, *args):
-        '''Browser call-in to directly invoke snapconnect methods'''
-        func = getattr(self.snapconnect, func, None)
-        if callable(func):
-            func(*args)
+        '''Browser call-in to directly invoke snapconnect methods.
+           RPC sends go out on the least-loaded bridge (or wait for one); anything else is local.
+        '''
+        method = getattr(self.snapconnect, func, None)
+        if not callable(method):
+            return
+        if func in self.OUTBOUND_METHODS:
+            self.send_outbound(func, args)
+        else:
+            method(*args)
+
+    def start_profile(self, seconds):
+        """Browser call-in: run the sampling profiler. The result is served at /admin/profile."""
+        done = lambda result: log.info('Profile complete: %(samples)d samples in %(seconds).1fs', profiler.last_info)
+        if not profiler.start(seconds, on_done=done):
+            log.info('Profile already running')
 
     def do_log(self, *args):
         log.info(*args)
 
-    def on_connected(self, addr_pair, remote_snap_addr):
-        self.connected = True
-        log.debug("on_connected(%s)" % str(addr_pair))
+    def on_connected(self, addr_pair, remote_snap_addr, bridge):
+        log.debug("on_connected(%s, %s)" % (bridge.name, str(addr_pair)))
+        self.bridge_up(bridge)
         
-    def on_disconnected(self, addr_pair, remote_snap_addr):
+    def on_disconnected(self, addr_pair, remote_snap_addr, bridge):
         """Called by SNAP Connect when a SNAP TCP connection has been disconnected or failed to connect"""
-        self.connected = False
-        log.debug("on_disconnected(%s)" % str(addr_pair))
+        log.debug("on_disconnected(%s, %s)" % (bridge.name, str(addr_pair)))
+        self.bridge_down(bridge)
+
+class StatsHandler(tornado.web.RequestHandler):
+    """Node runtime stats as JSON: latest report per node, or full history with ?history=1"""
+    def get(self):
+        if self.get_argument('history', None):
+            self.write(dict((addr, list(reports)) for addr, reports in snapCom.stats.items()))
+        else:
+            self.write(dict((addr, reports[-1]) for addr, reports in snapCom.stats.items()))
+
+
+class TraceHandler(tornado.web.RequestHandler):
+    """Per-stage latency histograms for traced distance reports as JSON. ?reset=1 clears them."""
+    def get(self):
+        self.write(snapCom.tracer.as_dict())
+        if self.get_argument('reset', None):
+            snapCom.tracer.reset()
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    """Server metrics in Prometheus text format"""
+    def get(self):
+        self.set_header('Content-Type', metrics.Registry.CONTENT_TYPE)
+        self.write(metrics_registry.render())
+
+
+class SlowCallbacksHandler(tornado.web.RequestHandler):
+    """Admin: slowest IOLoop callbacks caught by the watchdog, with stack samples. ?reset=1 clears the table."""
+    def get(self):
+        self.write(watchdog.top())
+        if self.get_argument('reset', None):
+            watchdog.reset()
+
+
+class ProfileHandler(tornado.web.RequestHandler):
+    """Admin: ?seconds=N runs the sampling profiler and returns collapsed stacks (optional &interval_ms=).
+       Without arguments, returns the last profile taken.
+    """
+    @web_asynchronous
+    def get(self):
+        self.set_header('Content-Type', 'text/plain')
+        seconds = self.get_argument('seconds', None)
+        if seconds is None:
+            self.finish(profiler.last_result or '')
+            return
+        interval = float(self.get_argument('interval_ms', 5)) / 1000.0
+        done = tornado.concurrent.Future()
+        if not profiler.start(float(seconds), interval, lambda result: done.set_result(self.finish(result))):
+            self.set_status(409)
+            self.finish('Profile already running\n')
+            return
+        # Tornado 6 has no @asynchronous: the request stays open until the returned Future resolves
+        return done
+
 
 class Application(tornado.web.Application):
     def __init__(self):
         handlers = [
             (r"/", tornado.web.RedirectHandler, {"url": "/index.html"}),
             (r"/wshub", WebSocketHandler),
+            (r"/stats", StatsHandler),
+            (r"/trace", TraceHandler),
+            (r"/metrics", MetricsHandler),
+            (r"/admin/slow", SlowCallbacksHandler),
+            (r"/admin/profile", ProfileHandler),
             (r"/(.*)", tornado.web.StaticFileHandler, {"path": os.path.join(os.path.dirname(__file__), "www")}),
         ]
         settings = dict(
@@ -145,14 +601,63 @@ class Application(tornado.web.Application):
         tornado.web.Application.__init__(self, handlers, **settings)
 
         
+def load_mcast_plan(path):
+    """Take the gateway's group interest and the control group/TTL from a mcast_planner.py plan"""
+    global group_interest_mask, control_group, control_ttl
+    with open(path) as f:
+        plan = json.load(f)
+    group_interest_mask = plan['gateway_interest']
+    control_group = plan['control_group']
+    control_ttl = plan['control_ttl']
+    log.info('Multicast plan: interest 0x%04x, control group 0x%04x TTL %d' %
+             (group_interest_mask, control_group, control_ttl))
+
+
+def setup_event_loop(kind):
+    """Run Tornado's IOLoop on the chosen event loop. Call before anything uses IOLoop.instance()."""
+    if kind == 'tornado':
+        return
+    try:
+        import asyncio
+    except ImportError:
+        raise SystemExit('--event-loop %s needs Python 3' % kind)
+    if kind == 'uvloop':
+        try:
+            import uvloop
+        except ImportError:
+            raise SystemExit('--event-loop uvloop needs the uvloop package')
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    if tornado.version_info < (5,):
+        # Tornado 5+ already runs on the current asyncio loop
+        from tornado.platform.asyncio import AsyncIOMainLoop
+        AsyncIOMainLoop().install()
+    log.info('Event loop: %s' % kind)
+
+
 def main():
+    global snapCom, watchdog, profiler
+    parser = argparse.ArgumentParser(description='IronMan demo application server')
+    parser.add_argument('--capture', metavar='FILE', help='Record SNAP call-ins to FILE for snap_capture.py replay')
+    parser.add_argument('--event-loop', choices=EVENT_LOOPS, default='tornado', help='Event loop under Tornado')
+    parser.add_argument('--mcast-plan', metavar='FILE', help='Multicast plan from mcast_planner.py')
+    parser.add_argument('--stall-ms', type=float, default=100, help='IOLoop lag that counts as a stall (watchdog)')
+    opts = parser.parse_args()
+
     logging.basicConfig(level=logging.INFO, format='%(asctime)-15s %(levelname)-8s %(name)-8s %(message)s')
     log.info("***** Begin Console Log *****")
+    setup_event_loop(opts.event_loop)
+    if opts.mcast_plan:
+        load_mcast_plan(opts.mcast_plan)
 
     app = Application()
     app.listen(80)
     
-    snapCom = SnapCom()
+    capture = snap_capture.CaptureWriter(opts.capture) if opts.capture else None
+    snapCom = SnapCom(capture=capture)
+    watchdog = ioloop_watchdog.IOLoopWatchdog(IOLOOP_LAG_SECONDS, opts.stall_ms / 1000.0)
+    watchdog.start()
+    profiler = sampling_profiler.SamplingProfiler()
     
     tornado.ioloop.IOLoop.instance().start()
     
@@ -0,0 +1,163 @@
+# (c) Copyright 2015, Synapse Wireless, Inc.
+"""Benchmark app_server event loops with the same simulated traffic
+   For each event loop, starts snap_capture.py (app_server in replay mode, no SNAP hardware) on a
+   capture, connects WebSocket clients that acknowledge traced reports like the browser does, and
+   reports startup time, call-in and WebSocket throughput, and send->ack latency.
+
+     python bench_server.py                                  (synthetic traffic, all loops available)
+     python bench_server.py --capture demo.snapcap --loops tornado asyncio --clients 20
+
+   Without --capture, a synthetic capture of traced distance reports (dist_trace) is generated, so
+   the ack latency stage is populated. A loop that cannot run here (e.g. asyncio on Python 2) is
+   reported as skipped.
+"""
+
+import tornado.gen
+import tornado.ioloop
+import tornado.websocket
+
+from snap_capture import CaptureWriter
+
+import argparse
+import json
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    from urllib2 import urlopen
+except ImportError:
+    from urllib.request import urlopen  # Python 3
+
+STARTUP_TIMEOUT = 30.0 # seconds
+
+
+def make_capture(path, sensors, rate, seconds):
+    '''Write a synthetic capture: each sensor sends dist_trace at rate per second'''
+    writer = CaptureWriter(path)
+    interval = 1.0 / (rate * sensors)
+    for n in range(int(seconds * rate * sensors)):
+        index = n % sensors
+        t = n * interval
+        writer.record(t, b'\x5d\x00' + struct.pack('<B', index), 'dist_trace',
+                      (index, 20 + (n * 7) % 150, int(t * 1000) & 0x7FFF, 2))
+    writer.close()
+
+
+@tornado.gen.coroutine
+def read_all(conn, counts):
+    '''Read until the server closes; acknowledge traced reports as the browser does after painting'''
+    while True:
+        msg = yield conn.read_message()
+        if msg is None:
+            break
+        message = json.loads(msg)
+        if message['funcname'] in ('report_dist', 'report_dist_summary'):
+            now = time.time()
+            counts['messages'] += 1
+            counts['first'] = counts['first'] or now
+            counts['last'] = now
+        if 'trace' in message:
+            conn.write_message(json.dumps({'funcname' : 'trace_ack', 'args' : [message['trace']]}))
+
+
+@tornado.gen.coroutine
+def run_clients(port, clients):
+    counts = {'messages' : 0, 'first' : None, 'last' : None}
+    conns = []
+    for _ in range(clients):
+        conn = yield tornado.websocket.websocket_connect('ws://127.0.0.1:%d/wshub' % port)
+        conns.append(conn)
+    yield [read_all(conn, counts) for conn in conns]
+    raise tornado.gen.Return(counts)
+
+
+def wait_for_server(port, proc):
+    '''Seconds until the server answers HTTP, or None if it exited'''
+    t_start = time.time()
+    while time.time() - t_start < STARTUP_TIMEOUT:
+        if proc.poll() is not None:
+            return None
+        try:
+            urlopen('http://127.0.0.1:%d/metrics' % port, timeout=1).read()
+            return time.time() - t_start
+        except Exception:
+            time.sleep(0.01)
+    return None
+
+
+def bench(loop, opts, capture, port):
+    cmd = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snap_capture.py'), capture,
+           '--speed', str(opts.speed), '--port', str(port), '--exit', '--wait-clients', str(opts.clients),
+           '--event-loop', loop]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=open(os.devnull, 'w'))
+    startup = wait_for_server(port, proc)
+    if startup is None:
+        proc.kill()
+        proc.wait()
+        return {'loop' : loop, 'skipped' : True}
+
+    counts = tornado.ioloop.IOLoop.current().run_sync(lambda: run_clients(port, opts.clients))
+    out, _ = proc.communicate()
+    lines = out.decode('utf-8').strip().splitlines()
+    summary = json.loads(lines[-1]) if lines else {}
+
+    span = (counts['last'] - counts['first']) if counts['first'] else 0
+    return {'loop' : loop,
+            'startup_ms' : startup * 1000,
+            'callins_per_sec' : summary.get('callins_per_sec'),
+            'max_lag_ms' : summary.get('max_lag_ms'),
+            'client_msgs' : counts['messages'],
+            'client_msgs_per_sec' : counts['messages'] / span if span else None,
+            'ack_mean_ms' : (summary.get('ack_latency') or {}).get('mean'),
+            'ack_max_ms' : (summary.get('ack_latency') or {}).get('max'),
+           }
+
+
+def fmt(val):
+    return '-' if val is None else '%.1f' % val
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark app_server event loops with replayed SNAP traffic')
+    parser.add_argument('--capture', help='Capture file (default: synthetic traced distance reports)')
+    parser.add_argument('--loops', nargs='+', default=['tornado', 'asyncio', 'uvloop'], help='Event loops to compare')
+    parser.add_argument('--clients', type=int, default=10, help='WebSocket clients')
+    parser.add_argument('--speed', type=float, default=0, help='Replay speed, 0 = as fast as possible')
+    parser.add_argument('--sensors', type=int, default=4, help='Synthetic capture: sensors')
+    parser.add_argument('--rate', type=float, default=20, help='Synthetic capture: reports per second per sensor')
+    parser.add_argument('--seconds', type=float, default=60, help='Synthetic capture: duration')
+    parser.add_argument('--port', type=int, default=8090, help='Server HTTP port')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    opts = parser.parse_args()
+
+    capture = opts.capture
+    if not capture:
+        fd, capture = tempfile.mkstemp(suffix='.snapcap')
+        os.close(fd)
+        make_capture(capture, opts.sensors, opts.rate, opts.seconds)
+
+    try:
+        results = [bench(loop, opts, capture, opts.port + i) for i, loop in enumerate(opts.loops)]
+    finally:
+        if not opts.capture:
+            os.remove(capture)
+
+    if opts.json:
+        print(json.dumps(results, indent=2))
+        return
+    print('%-8s %10s %10s %9s %10s %9s %9s' % ('loop', 'start ms', 'callins/s', 'lag ms', 'ws msgs/s', 'ack ms', 'ack max'))
+    for r in results:
+        if r.get('skipped'):
+            print('%-8s (skipped: could not start)' % r['loop'])
+            continue
+        print('%-8s %10s %10s %9s %10s %9s %9s' % (r['loop'], fmt(r['startup_ms']), fmt(r['callins_per_sec']),
+                                                   fmt(r['max_lag_ms']), fmt(r['client_msgs_per_sec']),
+                                                   fmt(r['ack_mean_ms']), fmt(r['ack_max_ms'])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+# (c) Copyright 2015, Synapse Wireless, Inc.
+"""Incremental min/max/mean rollups of distance reports
+   Each report is folded into every rollup as it arrives (O(1) per rollup). At the end of each
+   period, one summary for all sensors is produced and shared by every browser subscribed to it.
+"""
+
+
+class Rollup(object):
+    """Per-sensor min/max/mean over a fixed period"""
+
+    def __init__(self, level, period):
+        self.level = level      # subscription level name, e.g. '1s'
+        self.period = period    # seconds
+        self.acc = {}           # sensor index -> [count, min, max, sum]
+
+    def add(self, index, val):
+        a = self.acc.get(index)
+        if a is None:
+            self.acc[index] = [1, val, val, val]
+        else:
+            a[0] += 1
+            if val < a[1]:
+                a[1] = val
+            if val > a[2]:
+                a[2] = val
+            a[3] += val
+
+    def flush(self):
+        '''Return summary rows [index, min, max, mean, count] for the period just ended, and start a new one'''
+        rows = [[index, a[1], a[2], float(a[3]) / a[0], a[0]] for index, a in sorted(self.acc.items())]
+        self.acc = {}
+        return rows
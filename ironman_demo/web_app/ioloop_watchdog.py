@@ -0,0 +1,128 @@
+# (c) Copyright 2015, Synapse Wireless, Inc.
+"""IOLoop lag measurement and stall watchdog for app_server
+   Everything (SNAP polling, RPC dispatch, WebSocket writes, static files) shares one IOLoop, so one
+   slow callback delays radio processing for all of it.
+
+   IOLoopLagMonitor re-arms a short timer and records how late it fires.
+   IOLoopWatchdog adds a background thread that notices when that timer is overdue by more than a
+   threshold, samples the IOLoop thread's stack while it is still stuck, and keeps a table of the
+   slowest callbacks seen (keyed by the outermost frame below the event loop) for the admin endpoint.
+"""
+
+import tornado.ioloop
+
+import os
+import sys
+import threading
+import time
+import traceback
+
+# Event loop packages (Tornado, and asyncio/uvloop underneath it with --event-loop); a stall is named
+# after the first frame the loop dispatched outside these
+LOOP_PACKAGES = tuple(os.sep + pkg + os.sep for pkg in ('tornado', 'asyncio', 'uvloop'))
+
+
+class IOLoopLagMonitor(object):
+    """Measure how late the IOLoop runs a timer, as a proxy for how long callbacks are stalling it"""
+    INTERVAL = 0.1 # seconds
+
+    def __init__(self, histogram, ioloop=None):
+        self.histogram = histogram
+        self.ioloop = ioloop or tornado.ioloop.IOLoop.instance()
+        self.deadline = None
+
+    def start(self):
+        self.deadline = time.time() + self.INTERVAL
+        self.ioloop.add_timeout(self.deadline, self.check)
+
+    def check(self):
+        lag = max(0.0, time.time() - self.deadline)
+        self.histogram.observe(lag)
+        self.on_lag(lag)
+        self.start()
+
+    def on_lag(self, lag):
+        pass
+
+
+class IOLoopWatchdog(IOLoopLagMonitor):
+    """Lag monitor that also samples and tabulates the callbacks responsible for stalls.
+       Call start() from the thread that runs the IOLoop.
+    """
+    MAX_ENTRIES = 100   # distinct callbacks kept; fastest are dropped beyond this
+    MAX_STACK = 30      # frames kept per sample
+
+    def __init__(self, histogram, threshold=0.1, top_n=10, ioloop=None):
+        IOLoopLagMonitor.__init__(self, histogram, ioloop)
+        self.threshold = threshold
+        self.top_n = top_n
+        self.ioloop_thread = None
+        self.sample = None  # (callback, stack) of the stall in progress
+        self.entries = {}   # callback -> stall stats
+        self.lock = threading.Lock()
+
+    def start(self):
+        IOLoopLagMonitor.start(self)
+        if self.ioloop_thread is None:
+            self.ioloop_thread = threading.current_thread().ident
+            t = threading.Thread(target=self.watch, name='ioloop-watchdog')
+            t.daemon = True
+            t.start()
+
+    def watch(self):
+        '''Watchdog thread: sample the IOLoop stack once per stall'''
+        while True:
+            time.sleep(self.threshold / 2)
+            if self.sample is None and time.time() - self.deadline > self.threshold:
+                frame = sys._current_frames().get(self.ioloop_thread)
+                if frame is not None:
+                    self.sample = self.describe(frame)
+
+    def describe(self, frame):
+        '''Return (callback name, formatted stack) for a stuck IOLoop frame'''
+        stack = traceback.extract_stack(frame)
+        in_ioloop = False
+        callback = None
+        for filename, lineno, func, _ in stack:
+            if any(pkg in filename for pkg in LOOP_PACKAGES):
+                in_ioloop = True
+            elif in_ioloop:
+                # Outermost frame below the IOLoop is the callback it dispatched
+                callback = '%s:%s' % (os.path.basename(filename), func)
+                break
+        if callback is None:
+            filename, lineno, func, _ = stack[-1]
+            callback = '%s:%s' % (os.path.basename(filename), func)
+        return callback, traceback.format_list(stack[-self.MAX_STACK:])
+
+    def on_lag(self, lag):
+        sample, self.sample = self.sample, None
+        if sample is None or lag < self.threshold:
+            return
+        callback, stack = sample
+        with self.lock:
+            entry = self.entries.get(callback)
+            if entry is None:
+                if len(self.entries) >= self.MAX_ENTRIES:
+                    fastest = min(self.entries, key=lambda k: self.entries[k]['max_ms'])
+                    del self.entries[fastest]
+                entry = self.entries[callback] = {'callback' : callback, 'count' : 0, 'total_ms' : 0.0,
+                                                  'max_ms' : 0.0}
+            ms = lag * 1000.0
+            entry['count'] += 1
+            entry['total_ms'] += ms
+            entry['last_ms'] = ms
+            entry['last_time'] = time.time()
+            if ms >= entry['max_ms']:
+                entry['max_ms'] = ms
+                entry['stack'] = stack
+
+    def top(self):
+        '''Slowest callbacks, worst first'''
+        with self.lock:
+            entries = sorted(self.entries.values(), key=lambda e: e['max_ms'], reverse=True)
+        return {'threshold_ms' : self.threshold * 1000.0, 'stalls' : entries[:self.top_n]}
+
+    def reset(self):
+        with self.lock:
+            self.entries.clear()
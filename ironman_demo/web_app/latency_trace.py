@@ -0,0 +1,100 @@
+# (c) Copyright 2015, Synapse Wireless, Inc.
+"""End-to-end latency tracing for IronMan distance reports
+   Traced reports come from sonic_ranger with TRACE_DIST enabled, as dist_trace(index, val, tick, echo_ms).
+   Each one is given a trace id that travels with the browser message; the browser echoes it back
+   in trace_ack() after the next frame is painted. Per-stage latencies (ms):
+
+     node     echo capture -> multicast send, measured on the node
+     mesh     node send -> gateway receive, in excess of the fastest seen from that node
+              (node and server clocks are not synchronized, so only the variable part is measurable)
+     server   gateway receive -> WebSocket writes queued to every browser
+     browser  WebSocket write -> browser paint -> trace_ack received (round trip)
+"""
+
+import collections
+import time
+
+# Histogram bucket upper bounds, ms
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class Histogram(object):
+    """Fixed-bucket latency histogram"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, ms):
+        i = 0
+        while i < len(self.buckets) and ms > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += ms
+        self.max = max(self.max, ms)
+
+    def as_dict(self):
+        labels = ['<=%g' % b for b in self.buckets] + ['>%g' % self.buckets[-1]]
+        return {'count' : self.count,
+                'mean' : self.sum / self.count if self.count else None,
+                'max' : self.max,
+                'buckets' : collections.OrderedDict(zip(labels, self.counts)),
+               }
+
+
+class LatencyTracer(object):
+    """Track traced reports through the pipeline and aggregate per-stage histograms"""
+    STAGES = ('node', 'mesh', 'server', 'browser')
+    MAX_PENDING = 1000  # traces awaiting browser acks; oldest are dropped
+
+    def __init__(self):
+        self.stages = collections.OrderedDict((name, Histogram()) for name in self.STAGES)
+        self.pending = collections.OrderedDict()  # trace id -> server send time
+        self.mesh_offset = {}  # node address -> smallest (receive ms - node tick) seen, mod 2^16
+        self.next_id = 0
+
+    def received(self, addr, tick, echo_ms):
+        '''Traced report arrived from node addr. Returns (trace id, receive time).'''
+        now = time.time()
+        self.stages['node'].add(echo_ms)
+
+        offset = (int(now * 1000) - tick) & 0xFFFF
+        best = self.mesh_offset.setdefault(addr, offset)
+        excess = (offset - best) & 0xFFFF
+        if excess >= 0x8000:
+            # Faster than any before (modulo tick wrap)
+            self.mesh_offset[addr] = offset
+            excess = 0
+        self.stages['mesh'].add(excess)
+
+        self.next_id += 1
+        return self.next_id, now
+
+    def sent(self, trace_id, t_received):
+        '''Report for trace_id has been written to all browsers'''
+        now = time.time()
+        self.stages['server'].add((now - t_received) * 1000.0)
+        self.pending[trace_id] = now
+        if len(self.pending) > self.MAX_PENDING:
+            self.pending.popitem(last=False)
+
+    def acked(self, trace_id):
+        '''Browser has painted the report for trace_id. Each browser acks once.'''
+        t_sent = self.pending.get(trace_id)
+        if t_sent is not None:
+            self.stages['browser'].add((time.time() - t_sent) * 1000.0)
+
+    def reset(self):
+        for hist in self.stages.values():
+            hist.reset()
+        self.mesh_offset.clear()
+
+    def as_dict(self):
+        return collections.OrderedDict((name, hist.as_dict()) for name, hist in self.stages.items())
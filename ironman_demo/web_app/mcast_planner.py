@@ -0,0 +1,138 @@
+# (c) Copyright 2015, Synapse Wireless, Inc.
+"""Multicast group and forwarding-mask planner for IronMan demo installs
+   From a topology description, assigns telemetry (ranger 'dist' reports) and control traffic to
+   separate multicast groups. Each node is given interest only in the groups it consumes, and
+   forwarding only for groups it relays on a shortest path between a sender and a receiver.
+   Rangers get the smallest TTL that reaches every telemetry receiver.
+
+   The gateway (SNAP Connect) reaches the mesh through bridge nodes over serial or TCP, and each
+   bridge is a multicast hop of its own: it must forward the telemetry and control groups, and
+   TTLs to or from the gateway count the gateway-bridge hop. Bridges are planned like any other
+   node, so they run snappyImages/bridge_stick.py to apply their masks.
+
+   Output is a fleet config for nv_provision.py. Nodes apply it at boot through
+   nv_settings.init_nv_settings()/apply_mcast_plan(), and app_server reads the gateway's
+   interest mask and the control group and TTL from it (SnapCom.control_rpc):
+     python mcast_planner.py topology.json > plan.json
+     python nv_provision.py plan.json
+     python app_server.py --mcast-plan plan.json
+
+   Topology file (JSON). Roles are 'ranger' or 'head'; links are radio neighbors. The gateway is
+   linked to each of its bridges, so it is not listed in links:
+     {"gateway": "ffb606",
+      "bridges": ["5d0001"],
+      "nodes": {"5d1234": "ranger", "5d1235": "ranger", "5d2000": "head"},
+      "links": [["5d0001", "5d2000"], ["5d2000", "5d1234"], ["5d1234", "5d1235"]]}
+"""
+
+import argparse
+import collections
+import json
+import sys
+
+# Group bits. Group 1 stays on every node (interest and forwarding) for Portal and management traffic.
+GROUP_MGMT = 0x0001
+GROUP_TELEMETRY = 0x0002
+GROUP_CONTROL = 0x0004
+
+
+def hop_counts(links, start):
+    '''BFS hop count from start to every reachable node'''
+    dist = {start : 0}
+    queue = collections.deque([start])
+    while queue:
+        node = queue.popleft()
+        for neighbor in links[node]:
+            if neighbor not in dist:
+                dist[neighbor] = dist[node] + 1
+                queue.append(neighbor)
+    return dist
+
+
+def plan_flow(hops, senders, receivers):
+    '''Return (relays, ttls) for multicast from senders to receivers.
+       relays: nodes on a shortest sender->receiver path, other than its ends.
+       ttls: per-sender hop count to its furthest receiver.
+    '''
+    relays = set()
+    ttls = {}
+    for s in senders:
+        reach = [t for t in receivers if t != s and t in hops[s]]
+        ttls[s] = max([hops[s][t] for t in reach] or [1])
+        for t in reach:
+            for v in hops:
+                if v not in (s, t) and s in hops[v] and t in hops[v] \
+                        and hops[v][s] + hops[v][t] == hops[s][t]:
+                    relays.add(v)
+    return relays, ttls
+
+
+def plan(topology):
+    gateway = topology['gateway']
+    bridges = topology.get('bridges')
+    if not bridges:
+        raise ValueError('topology lists no bridges between the gateway and the mesh')
+    roles = topology['nodes']
+    links = collections.defaultdict(set)
+    for a, b in topology['links']:
+        if gateway in (a, b):
+            raise ValueError('gateway has no radio; link its bridges instead (%s-%s)' % (a, b))
+        links[a].add(b)
+        links[b].add(a)
+    for bridge in bridges:
+        links[gateway].add(bridge)
+        links[bridge].add(gateway)
+    all_nodes = set(roles) | set(bridges) | set([gateway])
+    hops = dict((node, hop_counts(links, node)) for node in all_nodes)
+
+    rangers = [n for n, role in roles.items() if role == 'ranger']
+    heads = [n for n, role in roles.items() if role == 'head']
+
+    # Rangers hear each other's reports to sequence their pings; heads and gateway consume them.
+    telemetry_relays, ttls = plan_flow(hops, rangers, rangers + heads + [gateway])
+    control_relays, control_ttls = plan_flow(hops, [gateway], heads)
+
+    for node in all_nodes:
+        if node not in hops[gateway]:
+            sys.stderr.write('warning: %s is not reachable from gateway\n' % node)
+
+    nodes = {}
+    for node in all_nodes - set([gateway]):
+        role = roles.get(node, 'bridge')
+        interest = GROUP_MGMT
+        if role != 'bridge':
+            interest |= GROUP_TELEMETRY
+        if role == 'head':
+            interest |= GROUP_CONTROL
+        forward = GROUP_MGMT
+        if node in telemetry_relays:
+            forward |= GROUP_TELEMETRY
+        if node in control_relays:
+            forward |= GROUP_CONTROL
+        params = {'NV_PLAN_INTEREST' : interest, 'NV_PLAN_FORWARD' : forward}
+        if role == 'ranger':
+            params['NV_PLAN_TELEMETRY_GROUP'] = GROUP_TELEMETRY
+            params['NV_PLAN_TELEMETRY_TTL'] = ttls[node]
+        nodes[node] = params
+
+    return {'gateway_interest' : GROUP_MGMT | GROUP_TELEMETRY, 'control_group' : GROUP_CONTROL,
+            'control_ttl' : control_ttls[gateway], 'nodes' : nodes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Plan multicast groups and forwarding masks from a topology')
+    parser.add_argument('topology', help='JSON topology file')
+    opts = parser.parse_args()
+
+    with open(opts.topology) as f:
+        topology = json.load(f)
+    try:
+        result = plan(topology)
+    except ValueError as e:
+        parser.error(str(e))
+    json.dump(result, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
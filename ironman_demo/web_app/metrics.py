@@ -0,0 +1,143 @@
+# (c) Copyright 2015, Synapse Wireless, Inc.
+"""Lightweight metrics registry with Prometheus text exposition
+   Counters, gauges and histograms are updated in O(1) (histograms: a bisect over a short, fixed
+   bucket list), so instrumentation can stay on in the hot path. Cumulative buckets and the text
+   format are only built when /metrics is scraped. Rates (e.g. messages per second) come from
+   applying rate() to the counters in Prometheus.
+
+     registry = Registry()
+     msgs = registry.counter('ws_messages_out_total', 'WebSocket messages written')
+     msgs.inc()
+     callins = registry.counter('snap_callins_total', 'SNAP RPC call-ins', 'func')
+     callins.labels('dist').inc()
+"""
+
+import bisect
+
+# Default histogram bucket upper bounds, seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class Metric(object):
+    """Base for metrics with an optional single label. labels(value) returns the child for that value."""
+    kind = None
+
+    def __init__(self, name, doc, label=None):
+        self.name = name
+        self.doc = doc
+        self.label = label
+        self.children = {}
+        self.reset()
+
+    def labels(self, value):
+        child = self.children.get(value)
+        if child is None:
+            child = self.children[value] = self.__class__(self.name, self.doc)
+        return child
+
+    def samples(self):
+        '''Yield (suffix, label string, value) for text exposition'''
+        if self.label is None:
+            for sample in self.own_samples(''):
+                yield sample
+        else:
+            for value in sorted(self.children):
+                for sample in self.children[value].own_samples('%s="%s"' % (self.label, value)):
+                    yield sample
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def reset(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def own_samples(self, labels):
+        yield '', labels, self.value
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def reset(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, n=1):
+        self.value += n
+
+    def dec(self, n=1):
+        self.value -= n
+
+    def own_samples(self, labels):
+        yield '', labels, self.value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, doc, label=None, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        Metric.__init__(self, name, doc, label)
+
+    def labels(self, value):
+        child = self.children.get(value)
+        if child is None:
+            child = self.children[value] = Histogram(self.name, self.doc, buckets=self.buckets)
+        return child
+
+    def reset(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def own_samples(self, labels):
+        sep = ',' if labels else ''
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield '_bucket', '%s%sle="%g"' % (labels, sep, bound), total
+        total += self.counts[-1]
+        yield '_bucket', '%s%sle="+Inf"' % (labels, sep), total
+        yield '_sum', labels, self.sum
+        yield '_count', labels, total
+
+
+class Registry(object):
+    """Collection of metrics, rendered in Prometheus text format"""
+    CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self.metrics = []
+
+    def add(self, metric):
+        metric.name = self.prefix + metric.name
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, doc, label=None):
+        return self.add(Counter(name, doc, label))
+
+    def gauge(self, name, doc, label=None):
+        return self.add(Gauge(name, doc, label))
+
+    def histogram(self, name, doc, label=None, buckets=LATENCY_BUCKETS):
+        return self.add(Histogram(name, doc, label, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append('# HELP %s %s' % (metric.name, metric.doc))
+            lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+            for suffix, labels, value in metric.samples():
+                lines.append('%s%s%s %s' % (metric.name, suffix, '{%s}' % labels if labels else '', repr(value)))
+        return '\n'.join(lines) + '\n'
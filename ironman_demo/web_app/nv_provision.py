@@ -0,0 +1,196 @@
+# (c) Copyright 2015, Synapse Wireless, Inc.
+"""Fleet NV provisioning for IronMan demo nodes
+   Reads NV params from many nodes in parallel over SNAP Connect, diffs them against a desired
+   config file, and pushes only the differences. Each changed node is rebooted once, after all
+   of its writes are acknowledged.
+
+   Nodes must run a script importing nv_settings (nv_report/nv_push/nv_commit).
+   Stop app_server first, since both use the same SNAP bridge.
+
+   Usage:  python nv_provision.py fleet.json [--dry-run]
+
+   Config file (JSON). Per-node values override defaults; params may be given by name or id:
+     {"defaults": {"NV_PAN_LL": -100, "NV_PAN_UL": 200},
+      "nodes": {"5d1234": {"NV_NODE_INDEX": 1},
+                "5d1235": {"NV_NODE_INDEX": 2}}}
+"""
+
+from snapconnect import snap
+
+from app_server import serial_conn, serial_port, snap_addr
+
+import argparse
+import binascii
+import collections
+import json
+import logging
+import os
+import time
+
+log = logging.getLogger(__file__)
+
+# User NV param ids, mirroring snappyImages/nv_settings.py
+NV_USER_MIN_ID = 128
+NV_NAMES = {'NV_NODE_INDEX' : NV_USER_MIN_ID + 0,
+            'NV_PAN_LL' : NV_USER_MIN_ID + 8,
+            'NV_PAN_UL' : NV_USER_MIN_ID + 9,
+            'NV_PAN_TRIM' : NV_USER_MIN_ID + 10,
+            'NV_TILT_LL' : NV_USER_MIN_ID + 11,
+            'NV_TILT_UL' : NV_USER_MIN_ID + 12,
+            'NV_TILT_TRIM' : NV_USER_MIN_ID + 13,
+            'NV_PLAN_INTEREST' : NV_USER_MIN_ID + 14,
+            'NV_PLAN_FORWARD' : NV_USER_MIN_ID + 15,
+            'NV_PLAN_TELEMETRY_GROUP' : NV_USER_MIN_ID + 16,
+            'NV_PLAN_TELEMETRY_TTL' : NV_USER_MIN_ID + 17,
+           }
+
+
+def load_config(path):
+    '''Return {snap_addr: {nv_id: value}} from a fleet config file'''
+    with open(path) as f:
+        config = json.load(f)
+
+    defaults = config.get('defaults', {})
+    fleet = {}
+    for node, params in config['nodes'].items():
+        merged = dict(defaults)
+        merged.update(params)
+        addr = binascii.unhexlify(node.replace('.', ''))
+        fleet[addr] = dict((NV_NAMES.get(k) or int(k), v) for k, v in merged.items())
+    return fleet
+
+
+class NodeState(object):
+    """Provisioning progress of a single node"""
+    def __init__(self, desired):
+        self.desired = desired
+        self.current = {}
+        self.to_read = set(desired)
+        self.to_write = set()
+        self.failed = False
+
+    @property
+    def done(self):
+        return self.failed or not (self.to_read or self.to_write)
+
+
+class NvProvisioner(object):
+    """Read/diff/push NV params across many nodes, with a bounded number of RPCs in flight"""
+    MAX_IN_FLIGHT = 8
+    RPC_TIMEOUT = 1.5  # seconds
+    MAX_RETRIES = 3
+
+    def __init__(self, snapconnect, fleet, dry_run=False):
+        self.snapconnect = snapconnect
+        self.dry_run = dry_run
+        self.nodes = dict((addr, NodeState(desired)) for addr, desired in fleet.items())
+        self.queue = collections.deque()   # (addr, nv_id, is_write)
+        self.in_flight = {}                # (addr, nv_id) -> (is_write, sent_time, tries)
+        self.committed = []
+
+        snapconnect.add_rpc_func('nv_val', self.nv_val)
+        snapconnect.add_rpc_func('nv_ack', self.nv_ack)
+
+        for addr, node in self.nodes.items():
+            for nv_id in node.to_read:
+                self.queue.append((addr, nv_id, False))
+
+    def run(self):
+        while not all(node.done for node in self.nodes.values()):
+            self.check_timeouts()
+            self.send_queued()
+            self.snapconnect.poll()
+        return self.report()
+
+    def send_queued(self):
+        while self.queue and len(self.in_flight) < self.MAX_IN_FLIGHT:
+            addr, nv_id, is_write = self.queue.popleft()
+            self.send(addr, nv_id, is_write, 1)
+
+    def send(self, addr, nv_id, is_write, tries):
+        if self.nodes[addr].failed:
+            return
+        self.in_flight[(addr, nv_id)] = (is_write, time.time(), tries)
+        if is_write:
+            self.snapconnect.rpc(addr, 'nv_push', nv_id, self.nodes[addr].desired[nv_id])
+        else:
+            self.snapconnect.rpc(addr, 'nv_report', nv_id)
+
+    def check_timeouts(self):
+        now = time.time()
+        for key, (is_write, sent, tries) in list(self.in_flight.items()):
+            if now - sent < self.RPC_TIMEOUT:
+                continue
+            del self.in_flight[key]
+            addr, nv_id = key
+            if tries < self.MAX_RETRIES:
+                self.send(addr, nv_id, is_write, tries + 1)
+            else:
+                log.error("%s: no response for NV %d", binascii.hexlify(addr), nv_id)
+                self.nodes[addr].failed = True
+
+    def nv_val(self, nv_id, val):
+        '''Call-in from nv_settings.nv_report()'''
+        addr = self.snapconnect.rpc_source_addr()
+        node = self.nodes.get(addr)
+        if node is None or self.in_flight.pop((addr, nv_id), None) is None:
+            return
+        node.current[nv_id] = val
+        node.to_read.discard(nv_id)
+        if not node.to_read:
+            self.diff(addr, node)
+
+    def nv_ack(self, nv_id):
+        '''Call-in from nv_settings.nv_push()'''
+        addr = self.snapconnect.rpc_source_addr()
+        node = self.nodes.get(addr)
+        if node is None or self.in_flight.pop((addr, nv_id), None) is None:
+            return
+        node.to_write.discard(nv_id)
+        if not node.to_write:
+            self.commit(addr)
+
+    def diff(self, addr, node):
+        changes = [nv_id for nv_id, val in node.desired.items() if node.current.get(nv_id) != val]
+        for nv_id in changes:
+            log.info("%s: NV %d %r -> %r", binascii.hexlify(addr), nv_id, node.current.get(nv_id), node.desired[nv_id])
+        if self.dry_run:
+            return
+        node.to_write.update(changes)
+        for nv_id in changes:
+            self.queue.append((addr, nv_id, True))
+
+    def commit(self, addr):
+        '''All writes acknowledged: reboot node once to apply them'''
+        self.snapconnect.rpc(addr, 'nv_commit')
+        self.committed.append(addr)
+
+    def report(self):
+        failed = [addr for addr, node in self.nodes.items() if node.failed]
+        log.info("%d nodes, %d updated, %d failed", len(self.nodes), len(self.committed), len(failed))
+        for addr in failed:
+            log.error("FAILED: %s", binascii.hexlify(addr))
+        return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Push NV configuration to a fleet of SNAP nodes')
+    parser.add_argument('config', help='JSON fleet configuration file')
+    parser.add_argument('--dry-run', action='store_true', help='Read and diff only, do not write')
+    opts = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)-15s %(levelname)-8s %(message)s')
+
+    cur_dir = os.path.dirname(__file__)
+    snapconnect = snap.Snap(license_file = os.path.join(cur_dir, 'SrvLicense.dat'),
+                            addr = snap_addr,
+                            funcs = {}
+                           )
+    snapconnect.open_serial(serial_conn, serial_port)
+
+    provisioner = NvProvisioner(snapconnect, load_config(opts.config), opts.dry_run)
+    return 0 if provisioner.run() else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
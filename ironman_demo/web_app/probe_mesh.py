@@ -0,0 +1,174 @@
+# (c) Copyright 2015, Synapse Wireless, Inc.
+"""Mesh latency and packet-loss probe for IronMan demo nodes
+   Sends timestamped probe() RPCs over SNAP Connect at a controlled rate and size, unicast to each
+   listed node and/or multicast, and reports per-node RTT percentiles, loss and (multicast) hop counts.
+   Nodes must run a script importing probe.py. Stop app_server first, since both use the same SNAP bridge.
+
+   Each run is appended to a results file (JSON lines), so runs can be compared after firmware or
+   NV changes:
+     python probe_mesh.py --label before 5d1234 5d1235
+     python probe_mesh.py --label after 5d1234 5d1235 --compare before
+"""
+
+from snapconnect import snap
+
+from app_server import serial_conn, serial_port, snap_addr
+
+import argparse
+import binascii
+import json
+import logging
+import os
+import time
+
+log = logging.getLogger(__file__)
+
+
+def percentile(sorted_vals, pct):
+    '''Nearest-rank percentile of an already sorted list'''
+    if not sorted_vals:
+        return None
+    rank = max(0, int(round(pct / 100.0 * len(sorted_vals))) - 1)
+    return sorted_vals[min(rank, len(sorted_vals) - 1)]
+
+
+class MeshProbe(object):
+    """Fire probes and collect acknowledgments"""
+    SETTLE_TIME = 2.0  # seconds to wait for late replies after last probe
+
+    def __init__(self, snapconnect, nodes, rate, count, size, mcast_group, ttl):
+        self.snapconnect = snapconnect
+        self.nodes = nodes
+        self.interval = 1.0 / rate
+        self.count = count
+        self.pad = 'x' * size
+        self.mcast_group = mcast_group
+        self.ttl = ttl
+        self.sent = {}   # seq -> send time
+        self.rtts = dict((addr, []) for addr in nodes)
+        self.hops = dict((addr, []) for addr in nodes)
+        self.acked = dict((addr, set()) for addr in nodes)  # seqs answered, so duplicates are not counted twice
+        self.seq = 0
+
+        snapconnect.add_rpc_func('probe_ack', self.probe_ack)
+
+    def run(self):
+        next_send = time.time()
+        while self.seq < self.count:
+            now = time.time()
+            if now >= next_send:
+                self.send_probe(now)
+                next_send += self.interval
+            self.snapconnect.poll()
+
+        settle_end = time.time() + self.SETTLE_TIME
+        while time.time() < settle_end:
+            self.snapconnect.poll()
+
+    def send_probe(self, now):
+        # Keep seq within SNAPpy's 16-bit signed integers
+        seq = self.seq & 0x7FFF
+        self.sent[seq] = now
+        for acked in self.acked.values():
+            acked.discard(seq)   # seq has wrapped; its earlier answer is no longer a duplicate
+        if self.mcast_group:
+            self.snapconnect.mcast_rpc(self.mcast_group, self.ttl, 'probe', seq, self.pad)
+        else:
+            for addr in self.nodes:
+                self.snapconnect.rpc(addr, 'probe', seq, self.pad)
+        self.seq += 1
+
+    def probe_ack(self, seq, ttl_remaining, pad):
+        '''Call-in from probe.probe()'''
+        t_sent = self.sent.get(seq)
+        addr = self.snapconnect.rpc_source_addr()
+        if t_sent is None or addr not in self.rtts or seq in self.acked[addr]:
+            return
+        self.acked[addr].add(seq)
+        self.rtts[addr].append((time.time() - t_sent) * 1000.0)
+        if self.mcast_group:
+            self.hops[addr].append(self.ttl - ttl_remaining + 1)
+
+    def results(self):
+        results = {}
+        for addr in self.nodes:
+            rtts = sorted(self.rtts[addr])
+            hops = self.hops[addr]
+            results[binascii.hexlify(addr).decode('ascii')] = {
+                'sent' : self.seq,
+                'received' : len(rtts),
+                'loss_pct' : 100.0 * (self.seq - len(rtts)) / self.seq if self.seq else None,
+                'rtt_p50' : percentile(rtts, 50),
+                'rtt_p90' : percentile(rtts, 90),
+                'rtt_p99' : percentile(rtts, 99),
+                'rtt_max' : rtts[-1] if rtts else None,
+                'hops' : max(hops) if hops else None,
+            }
+        return results
+
+
+def load_run(path, label):
+    '''Most recent stored run with the given label, or None'''
+    run = None
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                entry = json.loads(line)
+                if entry['label'] == label:
+                    run = entry
+    return run
+
+
+def fmt(val):
+    return '-' if val is None else '%.1f' % val
+
+
+def print_results(results, baseline=None):
+    print('%-8s %6s %7s %7s %7s %7s %4s' % ('node', 'loss%', 'p50ms', 'p90ms', 'p99ms', 'maxms', 'hops'))
+    for addr in sorted(results):
+        r = results[addr]
+        print('%-8s %6s %7s %7s %7s %7s %4s' % (addr, fmt(r['loss_pct']), fmt(r['rtt_p50']), fmt(r['rtt_p90']),
+                                                 fmt(r['rtt_p99']), fmt(r['rtt_max']), r['hops'] or '-'))
+        if baseline and addr in baseline:
+            b = baseline[addr]
+            print('%-8s %6s %7s %7s %7s %7s %4s' % ('  (was)', fmt(b['loss_pct']), fmt(b['rtt_p50']), fmt(b['rtt_p90']),
+                                                     fmt(b['rtt_p99']), fmt(b['rtt_max']), b['hops'] or '-'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure RTT, loss and hop counts to SNAP nodes')
+    parser.add_argument('nodes', nargs='+', help='Node SNAP addresses (hex)')
+    parser.add_argument('--rate', type=float, default=5.0, help='Probes per second')
+    parser.add_argument('--count', type=int, default=100, help='Number of probes')
+    parser.add_argument('--size', type=int, default=0, help='Probe padding bytes')
+    parser.add_argument('--mcast', type=int, default=0, metavar='GROUP', help='Multicast to group instead of unicast')
+    parser.add_argument('--ttl', type=int, default=4, help='Multicast TTL')
+    parser.add_argument('--label', default=time.strftime('%Y%m%d-%H%M%S'), help='Name stored with this run')
+    parser.add_argument('--results', default='probe_results.jsonl', help='Results file')
+    parser.add_argument('--compare', metavar='LABEL', help='Show stored run with this label alongside')
+    opts = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)-15s %(levelname)-8s %(message)s')
+
+    cur_dir = os.path.dirname(__file__)
+    snapconnect = snap.Snap(license_file = os.path.join(cur_dir, 'SrvLicense.dat'),
+                            addr = snap_addr,
+                            funcs = {}
+                           )
+    snapconnect.open_serial(serial_conn, serial_port)
+
+    nodes = [binascii.unhexlify(n.replace('.', '')) for n in opts.nodes]
+    prober = MeshProbe(snapconnect, nodes, opts.rate, opts.count, opts.size, opts.mcast, opts.ttl)
+    prober.run()
+    results = prober.results()
+
+    baseline = load_run(opts.results, opts.compare) if opts.compare else None
+    print_results(results, baseline['results'] if baseline else None)
+
+    with open(opts.results, 'a') as f:
+        f.write(json.dumps({'label' : opts.label, 'time' : time.time(), 'rate' : opts.rate,
+                            'size' : opts.size, 'mcast' : opts.mcast, 'results' : results}) + '\n')
+
+
+if __name__ == '__main__':
+    main()
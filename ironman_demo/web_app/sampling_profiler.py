@@ -0,0 +1,87 @@
+# (c) Copyright 2015, Synapse Wireless, Inc.
+"""On-demand sampling profiler for app_server
+   A background thread samples the IOLoop thread's stack at a fixed interval for a chosen duration,
+   and counts identical stacks. Nothing is hooked into the profiled code (unlike cProfile), so the
+   cost is one stack walk per sample and it can be run on a live gateway.
+
+   Output is collapsed-stack text, one "frame;frame;...;frame count" line per distinct stack,
+   ready for flamegraph.pl or speedscope:
+     curl 'http://gateway/admin/profile?seconds=10' > app.folded
+     flamegraph.pl app.folded > app.svg
+"""
+
+import tornado.ioloop
+
+import collections
+import os
+import sys
+import threading
+import time
+
+
+class SamplingProfiler(object):
+    """Sample one thread's stack (by default the caller's, i.e. the IOLoop thread)"""
+    DEFAULT_INTERVAL = 0.005 # seconds
+    MAX_SECONDS = 300
+
+    def __init__(self, ioloop=None, thread_id=None):
+        self.ioloop = ioloop or tornado.ioloop.IOLoop.instance()
+        self.thread_id = thread_id or threading.current_thread().ident
+        self.running = False
+        self.last_result = None
+        self.last_info = None
+
+    def start(self, seconds, interval=DEFAULT_INTERVAL, on_done=None):
+        '''Profile for seconds. on_done(collapsed_text) is called on the IOLoop when finished.
+           Returns False if a profile is already running.
+        '''
+        if self.running:
+            return False
+        self.running = True
+        seconds = min(float(seconds), self.MAX_SECONDS)
+        t = threading.Thread(target=self.run, args=(seconds, interval, on_done), name='sampling-profiler')
+        t.daemon = True
+        t.start()
+        return True
+
+    def run(self, seconds, interval, on_done):
+        '''Profiler thread'''
+        counts = collections.defaultdict(int)
+        samples = 0
+        t_start = time.time()
+        t_end = t_start + seconds
+        while time.time() < t_end:
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            counts[tuple(stack)] += 1
+            samples += 1
+            time.sleep(interval)
+
+        result = self.collapse(counts)
+        self.ioloop.add_callback(lambda: self.finish(result, samples, time.time() - t_start, on_done))
+
+    def finish(self, result, samples, elapsed, on_done):
+        self.last_result = result
+        self.last_info = {'samples' : samples, 'seconds' : elapsed, 'time' : time.time()}
+        self.running = False
+        if on_done:
+            on_done(result)
+
+    @staticmethod
+    def collapse(counts):
+        '''Collapsed-stack text from {(innermost code, ..., outermost code): count}'''
+        names = {}
+        lines = []
+        for stack, count in counts.items():
+            frames = []
+            for code in reversed(stack):
+                name = names.get(code)
+                if name is None:
+                    name = names[code] = '%s:%s' % (os.path.basename(code.co_filename), code.co_name)
+                frames.append(name)
+            lines.append('%s %d' % (';'.join(frames), count))
+        lines.sort()
+        return '\n'.join(lines) + '\n'
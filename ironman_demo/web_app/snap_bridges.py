@@ -0,0 +1,81 @@
+# (c) Copyright 2015, Synapse Wireless, Inc.
+"""Multiple SNAP bridges for the IronMan app_server
+   Each bridge is its own SNAP Connect instance (with its own SNAP address) on a serial stick or
+   TCP link, so radio traffic can be spread over several gateways, and one failing does not take
+   the dashboard down. A multicast heard by more than one bridge arrives once per bridge, so
+   call-ins are deduplicated; outbound RPCs go through the least-loaded connected bridge.
+   Lost serial and TCP links are reopened with exponential backoff and jitter.
+"""
+
+import collections
+import random
+import time
+
+
+class Bridge(object):
+    """One SNAP Connect instance and its link to the mesh"""
+    RETRY_MIN = 0.5 # seconds
+    RETRY_MAX = 30.0
+
+    def __init__(self, name, method=None, args=()):
+        self.name = name
+        self.method = method  # SNAP Connect method that opens the link, e.g. 'open_serial'
+        self.args = args
+        self.snapconnect = None
+        self.connected = False
+        self.load = 0.0  # outbound RPCs, decayed by half every decay() (see SnapCom)
+        self.attempts = 0 # reconnect attempts since last connected
+        self.retry = None # pending reconnect timeout
+
+    @property
+    def reconnects(self):
+        """Whether a lost link should be reopened (a listening bridge just waits for peers)"""
+        return self.method in ('open_serial', 'connect_tcp')
+
+    def retry_delay(self):
+        '''Delay before the next reconnect attempt: doubling from RETRY_MIN up to RETRY_MAX, then
+           randomized between half and all of that, so bridges reset together do not retry in lockstep
+        '''
+        delay = min(self.RETRY_MAX, self.RETRY_MIN * (2 ** min(self.attempts, 16)))
+        return random.uniform(delay / 2, delay)
+
+    def sent(self):
+        self.load += 1
+
+    def decay(self):
+        self.load /= 2.0
+
+
+def least_loaded(bridges):
+    '''Connected bridge with the fewest recent outbound RPCs, or the first bridge if none are connected'''
+    connected = [b for b in bridges if b.connected]
+    if not connected:
+        return bridges[0]
+    return min(connected, key=lambda b: b.load)
+
+
+class CallinDeduper(object):
+    """Drop call-ins that repeat one already received through a different bridge within a time window.
+       SNAP Connect does not expose packet sequence numbers to RPC handlers, so identical (source,
+       function, args) is the key. Repeats through the same bridge are genuine and always pass.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.seen = collections.OrderedDict()  # key -> (time, bridge), oldest first
+
+    def is_duplicate(self, key, bridge, now=None):
+        now = now or time.time()
+        # Expire from the oldest end: amortized O(1) per call-in
+        while self.seen:
+            oldest = next(iter(self.seen))
+            if now - self.seen[oldest][0] <= self.window:
+                break
+            del self.seen[oldest]
+
+        entry = self.seen.get(key)
+        if entry is not None and entry[1] is not bridge:
+            return True
+        self.seen.pop(key, None)
+        self.seen[key] = (now, bridge)
+        return False
@@ -0,0 +1,315 @@
+# (c) Copyright 2015, Synapse Wireless, Inc.
+"""Record and replay SNAP call-in traffic for the IronMan app_server
+   Capture every inbound SNAP RPC (time, source address, function, args) while the server runs
+   against live radios, then feed it back into SnapCom with no SNAP bridge attached. Server
+   throughput and latency can then be compared across changes with real traffic shapes.
+
+     python app_server.py --capture demo.snapcap
+     python snap_capture.py demo.snapcap --speed 4 --port 8080
+     python snap_capture.py demo.snapcap --speed 0        (as fast as possible)
+
+   With --exit, a JSON summary (replay rate, lag, WebSocket messages, browser ack latency) is
+   written to stdout when the replay ends; bench_server.py uses this.
+
+   File format: 'SNAPCAP' + version byte, then one record per call-in:
+     <uint32 microseconds since previous record> <uint8 function id> <3-byte source address>
+     [<uint8 length> <function name>, on first use of a function id]
+     <uint8 arg count> then per arg a type tag: 'i' int32, 'f' float64, 'T'/'F' bool, 'N' None,
+     's' <uint16 length> bytes, 'u' <uint16 length> UTF-8 text
+   Args replay as the types they were recorded with, so text stays text (JSON-encodable) on
+   Python 3. Version 1 files recorded text as 's'; there, 's' args are read back as text if
+   they decode as UTF-8.
+"""
+
+import argparse
+import json
+import logging
+import numbers
+import os
+import struct
+import sys
+import time
+
+log = logging.getLogger(__file__)
+
+MAGIC = b'SNAPCAP\x02'
+MAGIC_V1 = b'SNAPCAP\x01'
+MAX_DELTA_US = 0xFFFFFFFF  # Longer gaps are shortened to ~71 minutes
+EXIT_GRACE = 2.0 # seconds after replay (--exit) for browser acks to arrive
+
+RECORD_HEAD = struct.Struct('<IB3s')
+BYTE = struct.Struct('<B')
+INT_ARG = struct.Struct('<i')
+FLOAT_ARG = struct.Struct('<d')
+STR_LEN = struct.Struct('<H')
+
+
+class CaptureWriter(object):
+    """Append call-in records to a capture file"""
+
+    def __init__(self, path):
+        self.f = open(path, 'wb')
+        self.f.write(MAGIC)
+        self.func_ids = {}
+        self.last_time = None
+        self.count = 0
+
+    def wrap(self, name, func, source_addr):
+        '''Return an RPC function that records each call, then invokes func.
+           source_addr is called to get the SNAP address of the current call-in.
+        '''
+        def recorded(*args):
+            self.record(time.time(), source_addr(), name, args)
+            return func(*args)
+        return recorded
+
+    def record(self, t, addr, name, args):
+        delta = 0 if self.last_time is None else int((t - self.last_time) * 1e6)
+        self.last_time = t
+
+        parts = []
+        func_id = self.func_ids.get(name)
+        if func_id is None:
+            func_id = self.func_ids[name] = len(self.func_ids)
+            parts.append(BYTE.pack(len(name)) + name.encode('ascii'))
+        parts.insert(0, RECORD_HEAD.pack(min(max(delta, 0), MAX_DELTA_US), func_id, addr or b'\x00\x00\x00'))
+
+        parts.append(BYTE.pack(len(args)))
+        for arg in args:
+            if arg is None:
+                parts.append(b'N')
+            elif arg is True:
+                parts.append(b'T')
+            elif arg is False:
+                parts.append(b'F')
+            elif isinstance(arg, numbers.Integral):
+                parts.append(b'i' + INT_ARG.pack(arg))
+            elif isinstance(arg, float):
+                parts.append(b'f' + FLOAT_ARG.pack(arg))
+            elif isinstance(arg, bytes):
+                parts.append(b's' + STR_LEN.pack(len(arg)) + arg)
+            else:
+                arg = (u'%s' % arg).encode('utf-8')
+                parts.append(b'u' + STR_LEN.pack(len(arg)) + arg)
+        self.f.write(b''.join(parts))
+        self.count += 1
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+def read_capture(path):
+    '''Generate (delay seconds, source address, function name, args) for each record in a capture file'''
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data.startswith(MAGIC_V1):
+        # Text and bytes were not told apart; on Python 3, take anything that decodes as text
+        legacy_text = bytes is not str
+    elif data.startswith(MAGIC):
+        legacy_text = False
+    else:
+        raise ValueError('%s is not a SNAP capture file' % path)
+
+    names = {}
+    pos = len(MAGIC)
+    while pos < len(data):
+        delta, func_id, addr = RECORD_HEAD.unpack_from(data, pos)
+        pos += RECORD_HEAD.size
+        if func_id not in names:
+            n = BYTE.unpack_from(data, pos)[0]
+            names[func_id] = data[pos + 1:pos + 1 + n].decode('ascii')
+            pos += 1 + n
+
+        args = []
+        argc = BYTE.unpack_from(data, pos)[0]
+        pos += 1
+        for _ in range(argc):
+            tag = data[pos:pos + 1]
+            pos += 1
+            if tag == b'i':
+                args.append(INT_ARG.unpack_from(data, pos)[0])
+                pos += INT_ARG.size
+            elif tag == b'f':
+                args.append(FLOAT_ARG.unpack_from(data, pos)[0])
+                pos += FLOAT_ARG.size
+            elif tag in (b's', b'u'):
+                n = STR_LEN.unpack_from(data, pos)[0]
+                pos += STR_LEN.size
+                arg = data[pos:pos + n]
+                pos += n
+                if tag == b'u':
+                    arg = arg.decode('utf-8')
+                elif legacy_text:
+                    try:
+                        arg = arg.decode('utf-8')
+                    except UnicodeDecodeError:
+                        pass
+                args.append(arg)
+            else:
+                args.append({b'N' : None, b'T' : True, b'F' : False}[tag])
+        yield delta / 1e6, addr, names[func_id], tuple(args)
+
+
+class ReplaySnap(object):
+    """Stands in for snap.Snap during replay: no bridge, no license. Outbound calls are counted, not sent."""
+
+    def __init__(self):
+        self.source_addr = None
+        self.outbound = 0
+
+    def rpc_source_addr(self):
+        return self.source_addr
+
+    def rpc(self, addr, func, *args):
+        self.outbound += 1
+
+    def mcast_rpc(self, group, ttl, func, *args):
+        self.outbound += 1
+
+    def open_serial(self, *args):
+        pass
+
+    def save_nv_param(self, *args):
+        pass
+
+    def set_hook(self, *args):
+        pass
+
+    def poll_internals(self):
+        pass
+
+
+class Replayer(object):
+    """Feed a capture into SnapCom from the IOLoop, at a multiple of recorded speed (0 = as fast as possible)"""
+    BATCH = 100  # records per IOLoop callback at full speed, so browsers and other callbacks still get serviced
+
+    def __init__(self, ioloop, snap_com, records, speed):
+        self.ioloop = ioloop
+        self.snap_com = snap_com
+        self.records = records
+        self.speed = speed
+        self.count = 0
+        self.errors = 0
+        self.start_time = None
+        self.lag = 0.0  # worst lateness behind the schedule, seconds
+        self.pending = None
+        self.on_finish = None
+
+    def start(self):
+        self.start_time = self.next_time = time.time()
+        self.ioloop.add_callback(self.step)
+
+    def step(self):
+        for _ in range(self.BATCH):
+            rec = next(self.records, None)
+            if rec is None:
+                self.finish()
+                return
+            delay, addr, name, args = rec
+            if self.speed:
+                self.next_time += delay / self.speed
+                now = time.time()
+                if self.next_time > now:
+                    self.pending = rec
+                    self.ioloop.add_timeout(self.next_time, self.deliver_pending)
+                    return
+                self.lag = max(self.lag, now - self.next_time)
+            self.deliver(addr, name, args)
+        self.ioloop.add_callback(self.step)
+
+    def deliver_pending(self):
+        self.lag = max(self.lag, time.time() - self.next_time)
+        _, addr, name, args = self.pending
+        self.deliver(addr, name, args)
+        self.step()
+
+    def deliver(self, addr, name, args):
+        func = self.snap_com.snapRpcFuncs.get(name)
+        if func is None:
+            log.warning('Capture calls unknown function %s', name)
+            return
+        self.snap_com.snapconnect.source_addr = addr
+        try:
+            func(*args)
+        except:
+            self.errors += 1
+            log.exception('Error replaying %s%r', name, args)
+        self.count += 1
+
+    def summary(self):
+        elapsed = time.time() - self.start_time
+        return {'callins' : self.count,
+                'seconds' : elapsed,
+                'callins_per_sec' : self.count / elapsed if elapsed else 0,
+                'errors' : self.errors,
+                'max_lag_ms' : self.lag * 1000,
+                'outbound' : self.snap_com.snapconnect.outbound,
+               }
+
+    def finish(self):
+        log.info('Replayed %(callins)d call-ins in %(seconds).3fs (%(callins_per_sec).0f/s), %(errors)d errors, '
+                 'max lag %(max_lag_ms).1fms, %(outbound)d outbound RPCs', self.summary())
+        if self.on_finish:
+            self.on_finish()
+
+
+def main():
+    import tornado.ioloop
+    import app_server
+    import ioloop_watchdog
+    import sampling_profiler
+
+    parser = argparse.ArgumentParser(description='Replay a SNAP call-in capture into app_server without hardware')
+    parser.add_argument('capture', help='Capture file written by app_server.py --capture')
+    parser.add_argument('--speed', type=float, default=1.0, help='Multiple of recorded speed, 0 = as fast as possible')
+    parser.add_argument('--port', type=int, default=8080, help='HTTP port for browsers to watch the replay')
+    parser.add_argument('--loop', action='store_true', help='Repeat the capture until stopped')
+    parser.add_argument('--exit', action='store_true', help='Stop the server when replay finishes, printing a JSON summary')
+    parser.add_argument('--wait-clients', type=int, default=0, metavar='N', help='Start replay once N WebSockets are open')
+    parser.add_argument('--event-loop', choices=app_server.EVENT_LOOPS, default='tornado', help='Event loop under Tornado')
+    opts = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)-15s %(levelname)-8s %(name)-8s %(message)s')
+    app_server.setup_event_loop(opts.event_loop)
+
+    app = app_server.Application()
+    app.listen(opts.port)
+    app_server.snapCom = app_server.SnapCom(snapconnect=ReplaySnap())
+    app_server.watchdog = ioloop_watchdog.IOLoopWatchdog(app_server.IOLOOP_LAG_SECONDS)
+    app_server.watchdog.start()
+    app_server.profiler = sampling_profiler.SamplingProfiler()
+
+    ioloop = tornado.ioloop.IOLoop.instance()
+
+    def run():
+        if len(app_server.WebSocketHandler.waiters) < opts.wait_clients:
+            ioloop.add_timeout(time.time() + 0.05, run)
+            return
+        replayer = Replayer(ioloop, app_server.snapCom, read_capture(opts.capture), opts.speed)
+        if opts.loop:
+            replayer.on_finish = run
+        elif opts.exit:
+            replayer.on_finish = lambda: stop_after_grace(replayer.summary())
+        replayer.start()
+
+    def stop_after_grace(summary):
+        ioloop.add_timeout(time.time() + EXIT_GRACE, lambda: report_and_stop(summary))
+
+    def report_and_stop(summary):
+        summary['ws_messages_out'] = app_server.WS_MSGS_OUT.value
+        summary['ack_latency'] = app_server.snapCom.tracer.as_dict()['browser']
+        sys.stdout.write(json.dumps(summary) + '\n')
+        sys.stdout.flush()
+        ioloop.stop()
+
+    log.info('Replaying %s (%d bytes) at %s', opts.capture, os.path.getsize(opts.capture),
+             '%gx' % opts.speed if opts.speed else 'full speed')
+    run()
+    ioloop.start()
+
+
+if __name__ == '__main__':
+    main()
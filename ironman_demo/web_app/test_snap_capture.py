@@ -0,0 +1,82 @@
+# (c) Copyright 2015, Synapse Wireless, Inc.
+"""Round-trip check for snap_capture: record call-ins, read them back, and replay them into
+   SnapCom, through to the JSON written to browser WebSockets.
+
+     python -m unittest test_snap_capture
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import app_server
+import snap_capture
+
+
+class FakeWaiter(object):
+    """Stands in for a browser WebSocketHandler connection"""
+    def __init__(self):
+        self.messages = []
+
+    def write_message(self, message):
+        self.messages.append(message)
+
+
+class CaptureRoundTripTest(unittest.TestCase):
+    ADDR = b'\x5d\x12\x34'
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'test.snapcap')
+        self.waiter = FakeWaiter()
+        app_server.WebSocketHandler.waiters.add(self.waiter)
+        app_server.WebSocketHandler.unfiltered.add(self.waiter)
+
+    def tearDown(self):
+        app_server.WebSocketHandler.waiters.discard(self.waiter)
+        app_server.WebSocketHandler.unfiltered.discard(self.waiter)
+        shutil.rmtree(self.tmp_dir)
+
+    def record(self, calls):
+        writer = snap_capture.CaptureWriter(self.path)
+        for i, (name, args) in enumerate(calls):
+            writer.record(1000.0 + i * 0.2, self.ADDR, name, args)
+        writer.close()
+
+    def test_arg_types(self):
+        args = (u'report_dist', 3, -1.5, True, None, b'\x00\xff', u'caf\xe9')
+        self.record([('send_ws', args)])
+        records = list(snap_capture.read_capture(self.path))
+        self.assertEqual(records, [(0.0, self.ADDR, 'send_ws', args)])
+        self.assertTrue(isinstance(records[0][3][0], type(u'')))
+        self.assertTrue(isinstance(records[0][3][5], bytes))
+
+    def test_replay_to_websocket(self):
+        self.record([('send_ws', (u'report_dist', 2, 37)),
+                     ('send_ws', (u'log_msg', u'head online'))])
+        snap_com = app_server.SnapCom(snapconnect=snap_capture.ReplaySnap())
+        replayer = snap_capture.Replayer(None, snap_com, snap_capture.read_capture(self.path), 0)
+        for _, addr, name, args in replayer.records:
+            replayer.deliver(addr, name, args)
+
+        self.assertEqual(replayer.errors, 0)
+        self.assertEqual([json.loads(m) for m in self.waiter.messages],
+                         [{'funcname' : 'report_dist', 'args' : [2, 37]},
+                          {'funcname' : 'log_msg', 'args' : ['head online']}])
+        self.assertEqual(snap_com.snapconnect.source_addr, self.ADDR)
+
+    def test_version1_text(self):
+        # Version 1 recorded text as bytes ('s'); it must still replay as JSON-encodable text
+        self.record([('send_ws', (b'report_dist', 1, 12))])
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        with open(self.path, 'wb') as f:
+            f.write(snap_capture.MAGIC_V1 + data[len(snap_capture.MAGIC):])
+        args = list(snap_capture.read_capture(self.path))[0][3]
+        self.assertEqual(json.loads(json.dumps(args)), ['report_dist', 1, 12])
+
+
+if __name__ == '__main__':
+    unittest.main()
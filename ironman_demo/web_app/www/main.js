@@ -34,6 +34,36 @@ function report_dist(index, val) {
     set_blast(index, val);
 }
 
+// Call-in from server: distance summaries per sensor, [index, min, max, mean, count], for
+// pages subscribed to a rollup level (index.html?level=1s or ?level=10s)
+function report_dist_summary(period, rows) {
+    var i, row;
+    for (i = 0; i < rows.length; i++) {
+        row = rows[i];
+        plot(row[0], Math.round(row[3]));
+        // Blast shows the closest approach in the period
+        set_blast(row[0], Math.min(row[1], 100));
+    }
+}
+
+// Call-in from server: SNAP bridge link state ('connected', 'reconnecting' or 'disconnected').
+// Charts stop updating while no bridge is connected, so say so rather than show stale data as live.
+var bridge_states = {};
+
+function bridge_state(name, state, retry_in) {
+    var key, down = [];
+    if (state == 'reconnecting' && retry_in != null) {
+        state += ' (next try in ' + Math.ceil(retry_in) + 's)';
+    }
+    bridge_states[name] = state;
+    for (key in bridge_states) {
+        if (bridge_states[key] != 'connected') {
+            down.push(key + ': ' + bridge_states[key]);
+        }
+    }
+    $('#bridge_status').text(down.length ? 'SNAP bridge ' + down.join(', ') : '');
+}
+
 var blasters = Array();
 
 function initBlasters()  {
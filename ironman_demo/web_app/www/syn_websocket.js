@@ -10,12 +10,18 @@ function mcastRpc(group, ttl, func, args) {
     send_message('snap_method', ['mcastRpc', group, ttl, func].concat(args));
 }
 
+// Multicast to the IronMan heads on the gateway's planned control group
+function controlRpc(func, args) {
+    send_message('control_rpc', [func].concat(args));
+}
+
 // WebSocket Hub: Establish a socket between browser and SNAP Connect Web server. Provide API to send/receive messages
 var wsHub = {
     socket: null,
 
     start: function() {
-        var host = "ws://" + location.host + "/wshub"
+        // Page query string is passed through, e.g. index.html?level=1s for 1-second distance summaries
+        var host = "ws://" + location.host + "/wshub" + location.search
 
         // Detect WebSocket support
         if ("WebSocket" in window) {
@@ -38,12 +44,28 @@ var wsHub = {
 			} catch (err) {
 				console.log("Error executing websocket message: " + err.message);
 			}
+			if (message.trace !== undefined) {
+				ack_after_paint(message.trace);
+			}
         }
     },
 };
 
 
 
+// Latency tracing: acknowledge a traced message once the browser has painted the next frame
+function ack_after_paint(trace_id) {
+    var ack = function() {
+        send_message('trace_ack', [trace_id]);
+    };
+    if (window.requestAnimationFrame) {
+        // rAF runs just before paint; the timeout runs just after it
+        window.requestAnimationFrame(function() { setTimeout(ack, 0); });
+    } else {
+        setTimeout(ack, 0);
+    }
+}
+
 // wsHub Callback: Debug log function - TEST
 function do_print(message)  {
     console.log(message);
@@ -6,27 +6,117 @@
 '''SNAPpy LED Pulse-width Modulation Demo
     Sample SNAPpy script to demonstrate one method of setting up and using the PWM capability.
     This script is intended to be used with the SN173 evaluation boards.
+
+    Brightness is set as 0-255 and mapped through a gamma curve, so equal steps look equally bright.
+    Channels are Timer1 outputs: 0 = OC1A (LED2), 1 = OC1B (LED1), 2 = OC1C (I/O 7).
+    fade() and crossfade() run entirely on the node, stepped from the 10ms hook, so a host sends
+    one command per fade rather than a stream of duty values.
 '''
 from atmega128rfa1_timers import *
 from SN173 import *
 
+PWM_TOP = 1000
+OC1C_PIN = 7
+CHAN_OCR = (OCRxA, OCRxB, OCRxC)
+CHAN_PIN = (LED2, LED1, OC1C_PIN)
+
+# Perceptual brightness (0-255) to OCR count (0-PWM_TOP), gamma 2.2. A full 256-entry table is too
+# big for SNAPpy, so this holds every 16th level (the last entry is extrapolated so 255 maps to
+# PWM_TOP), and gamma() interpolates between them, within 2 counts of the exact curve.
+GAMMA_KNOTS = (0, 2, 10, 25, 48, 78, 117, 164, 220, 284, 359, 442, 536, 639, 752, 875, 1009)
+
+# Per-channel fade state: current and target brightness, and 10ms ticks remaining
+level0 = level1 = level2 = 0
+target0 = target1 = target2 = 0
+fade_ticks0 = fade_ticks1 = fade_ticks2 = 0
+
 # Run start-up function
 @setHook(HOOK_STARTUP)
 def start_up():
-    # Set pin direction as output
-    setPinDir(LED1, True)
-    
-    # Set pin state
-    writePin(LED1, False)
+    # Set channel pins as outputs, off. A channel's PWM output is connected while its level is non-zero.
+    i = 0
+    while i < len(CHAN_PIN):
+        setPinDir(CHAN_PIN[i], True)
+        writePin(CHAN_PIN[i], False)
+        i += 1
 
-    # Initialize timer1 with TOP = ICR, frequency = 16Mhz/64 = 250kHz
-    timer_init(TMR1, WGM_FASTPWM16_TOP_ICR, CLK2_FOSC_DIV64, 1000)
-    
-    # Initialize OC1A to toggle output
-    set_tmr_output(TMR1, OCRxB, TMR_OUTP_CLR)
-    setPinDir(LED1, True)
+    # Initialize timer1 with TOP = ICR, frequency = 16Mhz/64 = 250kHz, for a 250Hz PWM rate
+    timer_init(TMR1, WGM_FASTPWM16_TOP_ICR, CLK_FOSC_DIV64, PWM_TOP)
     
     
 def led_duty_cycle(val):
-    """ Control duty cycle by adjusting OCR1A from 0 - 1000 """
-    set_tmr_ocr(TMR1, OCRxB, val)
\ No newline at end of file
+    """ Control duty cycle by adjusting OCR1B from 0 - 1000 """
+    set_tmr_ocr(TMR1, OCRxB, val)
+    if val:
+        # Clear on match (non-inverting PWM)
+        set_tmr_output(TMR1, OCRxB, TMR_OUTP_CLR)
+    else:
+        set_tmr_output(TMR1, OCRxB, TMR_OUTP_OFF)
+
+def brightness(chan, val):
+    """Set channel brightness immediately (0-255), cancelling any fade"""
+    fade(chan, val, 0)
+
+def fade(chan, val, ticks):
+    """Fade channel to brightness val (0-255) over ticks x 10ms"""
+    global target0, target1, target2, fade_ticks0, fade_ticks1, fade_ticks2
+    val = 255 if val > 255 else 0 if val < 0 else val
+    if chan == 0:
+        target0 = val
+        fade_ticks0 = ticks
+    elif chan == 1:
+        target1 = val
+        fade_ticks1 = ticks
+    else:
+        target2 = val
+        fade_ticks2 = ticks
+    if not ticks:
+        set_level(chan, val)
+
+def crossfade(from_chan, to_chan, ticks):
+    """Fade one channel out while another fades in"""
+    fade(from_chan, 0, ticks)
+    fade(to_chan, 255, ticks)
+
+@setHook(HOOK_10MS)
+def tick10ms():
+    global fade_ticks0, fade_ticks1, fade_ticks2
+    # Each tick covers an equal share of the remaining change, landing exactly on target
+    if fade_ticks0:
+        set_level(0, level0 + (target0 - level0) / fade_ticks0)
+        fade_ticks0 -= 1
+    if fade_ticks1:
+        set_level(1, level1 + (target1 - level1) / fade_ticks1)
+        fade_ticks1 -= 1
+    if fade_ticks2:
+        set_level(2, level2 + (target2 - level2) / fade_ticks2)
+        fade_ticks2 -= 1
+
+def gamma(val):
+    """OCR count for brightness val (0-255), interpolated from GAMMA_KNOTS"""
+    i = val >> 4
+    lo = GAMMA_KNOTS[i]
+    return lo + (GAMMA_KNOTS[i + 1] - lo) * (val & 15) / 16
+
+def set_level(chan, val):
+    """Set channel brightness through gamma curve, writing OCR only on change.
+       Zero disconnects PWM: even OCR=0 leaves a one-tick pulse each period in fast PWM.
+    """
+    global level0, level1, level2
+    if chan == 0:
+        if val == level0:
+            return
+        level0 = val
+    elif chan == 1:
+        if val == level1:
+            return
+        level1 = val
+    else:
+        if val == level2:
+            return
+        level2 = val
+    if val:
+        set_tmr_ocr(TMR1, CHAN_OCR[chan], gamma(val))
+        set_tmr_output(TMR1, CHAN_OCR[chan], TMR_OUTP_CLR)
+    else:
+        set_tmr_output(TMR1, CHAN_OCR[chan], TMR_OUTP_OFF)